@@ -0,0 +1,237 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from copy import deepcopy
+from lxml import html
+from univeral_tree import build_lxml_tree, StructTree, ExtractionStats
+from suffix_array import ShardedSuffixArray
+
+SAMPLE_PAGES = ['amazon.html', 'google.html', 'comments.html']
+STAGES = [
+    'build_lxml_tree',
+    'struct_tree_build',
+    'annotate',
+    'pattern_miner_build',
+    'frequent_pattern',
+    'select_patterns',
+    'pattern_reduction',
+    'align_records',
+    'clean_nested_records',
+    'serialize',
+]
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Benchmark the extraction pipeline stage by stage on the example pages and scaled copies of them.')
+    parser.add_argument('inputs', nargs='*', default=SAMPLE_PAGES, help='Input HTML files. Default to the three example pages.')
+    parser.add_argument(
+        '--encoding',
+        type=str,
+        choices=[StructTree.STRUCT_PATTERN, StructTree.NODE_SIGNATURE_PATTERN, StructTree.HTP_PATTERN, StructTree.TAG_PATTERN],
+        default=StructTree.STRUCT_PATTERN,
+        help='The encoding scheme for nodes on the DOM tree. Defaults to "structure".'
+    )
+    parser.add_argument('--pattern-miner', type=str, choices=list(StructTree.PATTERN_MINERS), default=StructTree.SUFFIX_ARRAY_MINER, help='The frequent pattern miner. Default to "suffix-array".')
+    parser.add_argument('--len-thresh', type=int, default=5, help='Pattern length threshold. Default to 5.')
+    parser.add_argument('--freq-thresh', type=int, default=5, help='Pattern frequency threshold. Default to 5.')
+    parser.add_argument('--record-height-thresh', type=int, default=2, help='Subtree height threshold for target records. Default to 2.')
+    parser.add_argument('--record-size-thresh', type=int, default=2, help='Subtree size threshold for target records. Default to 2.')
+    parser.add_argument('--greedy-pattern', action='store_true', dest='greedy', help='Search frequent patterns with greedy strategy.')
+    parser.add_argument('--pruned-mining', action='store_true', help='Mine frequent patterns over the pruned node sequence.')
+    parser.add_argument('--mining-height-thresh', type=int, default=1, help='Mine frequent patterns over the nodes of this height or more only. Default to 1, all nodes.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10], help='Replicate the records of each page this many times, e.g. 1 10 100. Default to 1 10.')
+    parser.add_argument('--repeat', type=int, default=3, help='Run each page this many times and keep the fastest time of each stage. Default to 3.')
+    parser.add_argument('--output', type=str, help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', type=str, help='A JSON file from an earlier run to check the results against for regressions.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Relative slowdown of a stage that counts as a regression. Default to 0.25.')
+    parser.add_argument('--min-seconds', type=float, default=0.01, help='Slowdowns smaller than this many seconds are ignored as noise. Default to 0.01.')
+    parser.add_argument('--compare-miners', action='store_true', help='Instead of the stage benchmark, check that all pattern miners return the same patterns and compare their time and memory.')
+    parser.add_argument('--align-records', action='store_true', help='Instead of the stage benchmark, time _align_records alone on the anchors of every pattern of each page and measure its peak memory.')
+    return parser.parse_args()
+
+def run_pipeline(source, args, stats: ExtractionStats):
+    """Run the pipeline of run.py on the page source and return the number of nodes and the records found."""
+    with stats.stage('build_lxml_tree'):
+        eTree = build_lxml_tree(source)
+    sTree = StructTree(eTree, pattern_method=args.encoding, pattern_miner=args.pattern_miner, stats=stats, pruned_mining=args.pruned_mining, mining_height_thresh=args.mining_height_thresh)
+    recordGroups = sTree.record_boundary(
+        lenThresh=args.len_thresh,
+        freqThresh=args.freq_thresh,
+        recordHeightThresh=args.record_height_thresh,
+        recordSizeThresh=args.record_size_thresh,
+        greedyPattern=args.greedy,
+    )
+    sTree.annotate()
+    with stats.stage('serialize'):
+        for recordIndexes in recordGroups:
+            for i in recordIndexes:
+                sTree[i].elm.attrib['style'] = 'border: dashed darkgreen;'
+        html.tostring(eTree, pretty_print=True, encoding='utf-8')
+    return len(sTree), set(i for g in recordGroups for i in g)
+
+def full_sequence_records(source, args):
+    """The records found on the page source by mining the full node sequence."""
+    sTree = StructTree(build_lxml_tree(source), pattern_method=args.encoding, pattern_miner=args.pattern_miner)
+    return set(i for g in sTree.record_boundary(args.len_thresh, args.freq_thresh, args.record_height_thresh, args.record_size_thresh, greedyPattern=args.greedy) for i in g)
+
+def scale_page(source, factor, args):
+    """Return a synthetic page where every detected record is replicated factor times next to itself."""
+    eTree = build_lxml_tree(source)
+    sTree = StructTree(eTree, pattern_method=args.encoding, pattern_miner=args.pattern_miner)
+    recordGroups = sTree.record_boundary(args.len_thresh, args.freq_thresh, args.record_height_thresh, args.record_size_thresh, greedyPattern=args.greedy)
+    records = [sTree.elements[i] for i in sTree._outermost_nodes(set(i for g in recordGroups for i in g))]
+    for elm in records:
+        for _ in range(factor - 1):
+            elm.addnext(deepcopy(elm))
+    return html.tostring(eTree, encoding='unicode')
+
+def benchmark_page(name, source, scale, args):
+    best = None
+    for _ in range(args.repeat):
+        stats = ExtractionStats()
+        start = time.perf_counter()
+        nodeCnt, records = run_pipeline(source, args, stats)
+        seconds = {stage: stats.stageSeconds.get(stage, 0.0) for stage in STAGES}
+        seconds['total'] = time.perf_counter() - start
+        best = seconds if best is None else {k: min(v, seconds[k]) for k, v in best.items()}
+    # a separate run for memory, tracing allocations slows Python down too much to time the same run.
+    tracemalloc.start()
+    run_pipeline(source, args, ExtractionStats())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    ret = {
+        'page': name,
+        'scale': scale,
+        'nodes': nodeCnt,
+        'mined_nodes': stats.minedSequenceLength,
+        'records': len(records),
+        'seconds': {k: round(v, 6) for k, v in best.items()},
+        'peak_memory_bytes': peak,
+    }
+    if args.pruned_mining or args.mining_height_thresh > 1:
+        # what mining a shorter sequence changes: the records of the full sequence still found, and the new ones
+        fullRecords = full_sequence_records(source, args)
+        ret['records_kept'] = len(records & fullRecords)
+        ret['records_new'] = len(records - fullRecords)
+        ret['full_sequence_records'] = len(fullRecords)
+    return ret
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def find_regressions(results, baseline, tolerance, minSeconds):
+    """Return (page, scale, stage, old seconds, new seconds) for every stage that became slower than the tolerance allows."""
+    old = {(r['page'], r['scale']): r for r in baseline['results']}
+    ret = []
+    for r in results:
+        if (r['page'], r['scale']) not in old:
+            continue
+        oldSeconds = old[(r['page'], r['scale'])]['seconds']
+        for stage, seconds in r['seconds'].items():
+            if stage in oldSeconds and seconds > oldSeconds[stage] * (1 + tolerance) and seconds - oldSeconds[stage] > minSeconds:
+                ret.append((r['page'], r['scale'], stage, oldSeconds[stage], seconds))
+    return ret
+
+def measure(func, *args, **kwargs):
+    """
+    Run func and return its result, the wall time in seconds and the peak traced memory in bytes.
+    func is run twice, tracing allocations slows Python down too much to time the same run.
+    """
+    start = time.perf_counter()
+    ret = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ret, elapsed, peak
+
+def mine(minerClass, sequence, freqThresh, lenThresh, greedy):
+    miner = minerClass(sequence)
+    return miner.frequent_pattern(freqThresh, lenThresh, greedy=greedy)
+
+def compare_miners(path, encoding, lenThresh, freqThresh):
+    with open(path, encoding='utf-8') as file:
+        sTree = StructTree(build_lxml_tree(file.read()), pattern_method=encoding, pattern_miner=StructTree.SUFFIX_ARRAY_MINER)
+    sequence = sTree.nodeEncodingSequence
+    for greedy in [False, True]:
+        results = {}
+        for name, minerClass in StructTree.PATTERN_MINERS.items():
+            patterns, elapsed, peak = measure(mine, minerClass, sequence, freqThresh, lenThresh, greedy)
+            results[name] = patterns
+            print(f'{path:<16} {"greedy" if greedy else "closed":<7} {name:<20} {len(sequence):>7} nodes {len(patterns):>4} patterns {elapsed:>8.3f} s {peak / 2**20:>9.1f} MiB')
+        expected = results[StructTree.SUFFIX_TREE_MINER]
+        for name, patterns in results.items():
+            if list(patterns.items()) != list(expected.items()):
+                sys.exit(f'{name} differs from {StructTree.SUFFIX_TREE_MINER} on {path} (greedy={greedy}).')
+
+def pattern_anchors(source, args):
+    """The tree of the page and the anchors of every reduced pattern that record_boundary aligns, as in pattern_records."""
+    sTree = StructTree(build_lxml_tree(source), pattern_method=args.encoding, pattern_miner=args.pattern_miner)
+    frequentPattern = sTree.frequent_pattern(args.encoding, args.freq_thresh, args.len_thresh, greedy=args.greedy)
+    reduced = sTree._pattern_reduction(sTree._select_patterns(frequentPattern))
+    anchors = [sTree._get_anchor([x for x in patternIndexes if x[1] - x[0] >= args.len_thresh]) for patternIndexes in reduced.values()]
+    return sTree, [a for a in anchors if len(a) >= args.freq_thresh]
+
+def align_records(sTree, anchors, freqThresh):
+    return [sTree._align_records(a, freqThresh) for a in anchors]
+
+def benchmark_align(path, args):
+    with open(path, encoding='utf-8') as file:
+        source = file.read()
+    for scale in args.scales:
+        sTree, anchors = pattern_anchors(source if scale == 1 else scale_page(source, scale, args), args)
+        seconds = []
+        for _ in range(args.repeat):
+            _, elapsed, peak = measure(align_records, sTree, anchors, args.freq_thresh)
+            seconds.append(elapsed)
+        print(f'{path:<16} x{scale:<4} {len(sTree):>8} nodes {len(anchors):>5} patterns {sum(len(a) for a in anchors):>7} anchors {min(seconds):>8.4f} s {peak / 2**10:>9.1f} KiB', flush=True)
+
+def main(args):
+    results = []
+    for path in args.inputs:
+        with open(path, encoding='utf-8') as file:
+            source = file.read()
+        for scale in args.scales:
+            pageSource = source if scale == 1 else scale_page(source, scale, args)
+            r = benchmark_page(path, pageSource, scale, args)
+            results.append(r)
+            kept = f" ({r['records_kept']} of {r['full_sequence_records']} kept, {r['records_new']} new)" if 'records_kept' in r else ''
+            print(f"{path:<16} x{scale:<4} {r['nodes']:>8} nodes {r['mined_nodes']:>8} mined {r['records']:>6} records{kept} {r['seconds']['total']:>8.3f} s {r['peak_memory_bytes'] / 2**20:>8.1f} MiB  " +
+                ' '.join(f"{stage}={r['seconds'][stage]:.3f}" for stage in STAGES), flush=True)
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'settings': {k: v for k, v in vars(args).items() if k not in ['inputs', 'output', 'baseline', 'compare_miners', 'align_records']},
+        'results': results,
+    }
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = find_regressions(results, baseline, args.tolerance, args.min_seconds)
+        for page, scale, stage, oldSeconds, seconds in regressions:
+            print(f'Regression on {page} x{scale}: {stage} took {seconds:.3f} s, was {oldSeconds:.3f} s at {baseline.get("commit")}.')
+        if len(regressions) > 0:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    args = get_args()
+    if args.compare_miners:
+        # shard the example pages too, so that the comparison covers the merge of the worker results
+        ShardedSuffixArray.minLength = 0
+        for path in args.inputs:
+            compare_miners(path, args.encoding, args.len_thresh, args.freq_thresh)
+    elif args.align_records:
+        for path in args.inputs:
+            benchmark_align(path, args)
+    else:
+        main(args)
@@ -0,0 +1,38 @@
+from pickle_cache import PickleCache
+from univeral_tree import StructTree
+
+class FingerprintCache(PickleCache):
+    """
+    PickleCache of record_boundary results by StructTree.fingerprint and extraction settings, bounded to maxEntries, so
+    pages with the same layout skip pattern mining and record alignment. Results are kept in post-order index space,
+    they hold for any tree with the same fingerprint.
+    """
+    def __init__(self, path: str = None, maxEntries: int = 10000) -> None:
+        super().__init__(path, maxEntries)
+
+    def key(self, fingerprint: str, settings: tuple) -> str:
+        return f'{fingerprint}:{settings!r}'
+
+def extract_with_fingerprint(sTree: StructTree, cache: FingerprintCache, lenThresh: int, freqThresh: int, recordHeightThresh, recordSizeThresh, greedyPattern=False, budget=None):
+    """
+    StructTree.record_boundary with a fingerprint cache. If a tree with the same fingerprint was extracted with the same
+    settings, its record groups and record patterns are reused without mining. Only full extractions are cached, not the
+    ones the budget made degrade. Return the record groups and whether they came from the cache.
+    """
+    settings = (sTree.patternMethod, lenThresh, freqThresh, recordHeightThresh, recordSizeThresh, greedyPattern, sTree.miningHeightThresh)
+    key = cache.key(sTree.fingerprint(), settings)
+    entry = cache.get(key)
+    if entry is not None:
+        cache.hits += 1
+        recordGroups, recordPatterns = entry
+        sTree.recordPatterns = list(recordPatterns)
+        sTree.strategy = StructTree.FULL_STRATEGY
+        if sTree.stats is not None:
+            sTree.stats.recordGroups = len(recordGroups)
+            sTree.stats.records = sum(len(g) for g in recordGroups)
+        return set(recordGroups), True
+    cache.misses += 1
+    recordGroups = sTree.record_boundary(lenThresh, freqThresh, recordHeightThresh, recordSizeThresh, greedyPattern=greedyPattern, budget=budget)
+    if sTree.strategy == StructTree.FULL_STRATEGY:
+        cache.put(key, (sorted(recordGroups), list(sTree.recordPatterns)))
+    return recordGroups, False
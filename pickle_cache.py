@@ -0,0 +1,64 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+
+class PickleCache:
+    """
+    LRU cache of picklable values by str key, bounded to maxEntries. With a folder, values are also kept on disk, one
+    pickle file per key, so they survive the process and are shared by worker processes. The folder is bounded to
+    maxEntries too, the least recently used files are removed first.
+    """
+    def __init__(self, path: str = None, maxEntries: int = 1000) -> None:
+        self.path = path
+        self.maxEntries = maxEntries
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pkl')
+
+    def get(self, key: str):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if self.path is None or not os.path.isfile(self._file(key)):
+            return None
+        try:
+            with open(self._file(key), 'rb') as file:
+                value = pickle.load(file)
+            os.utime(self._file(key))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        self._remember(key, value)
+        return value
+
+    def put(self, key: str, value):
+        self._remember(key, value)
+        if self.path is None:
+            return
+        tmpPath = f'{self._file(key)}.{os.getpid()}.tmp'
+        with open(tmpPath, 'wb') as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpPath, self._file(key))
+        files = [os.path.join(self.path, f) for f in os.listdir(self.path) if f.endswith('.pkl')]
+        if len(files) > self.maxEntries:
+            files.sort(key=lambda f: os.stat(f).st_mtime)
+            for f in files[:len(files) - self.maxEntries]:
+                try:
+                    os.remove(f)
+                except OSError:
+                    pass
+
+    def _remember(self, key: str, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return 0 if total == 0 else self.hits / total
@@ -1,12 +1,37 @@
 import argparse
-from univeral_tree import build_lxml_tree, StructTree
+from univeral_tree import build_lxml_tree, sniff_format, path_format, StructTree, ExtractionStats, ExtractionConfig, ExtractionBudget, INPUT_FORMATS
+from run_utils import iter_records, percentile, page_timeout, PageTimeout
+from suffix_array import ShardedSuffixArray
+from template_cache import TemplateCache, extract_with_template
+from tree_cache import TreeCache, cached_tree
+from fingerprint_cache import FingerprintCache, extract_with_fingerprint
 from lxml import html
 import os
+import sys
+import glob
+import json
+import csv
+import itertools
+import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 
 def get_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument('input', help='Input HTML file.')
+    parser.add_argument('input', help='Input HTML or JSON file. For batch mode, a folder of .html and .json pages, a glob pattern, or a text file listing one input path per line.')
     parser.add_argument('--output', type=str, default='output.html', help='Output HTML file.')
+    parser.add_argument('--output-dir', type=str, default='output', help='Output folder in batch mode, the output files mirror the input paths. Default to "output".')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes in batch mode. Default to the number of CPUs.')
+    parser.add_argument('--max-in-flight', type=int, help='Maximum number of pages submitted to the workers at a time in batch mode. Default to twice the number of workers.')
+    parser.add_argument('--timeout', type=float, help='Time limit in seconds for each page in batch mode. No limit by default.')
+    parser.add_argument(
+        '--input-format',
+        type=str,
+        choices=INPUT_FORMATS,
+        help='The format of the input files, should be one of "html" and "json". Taken from the .html, .htm or .json extension of each file by default, otherwise detected from its first characters.'
+    )
     parser.add_argument(
         '--encoding', 
         type=str, 
@@ -44,98 +69,528 @@ def get_args():
         dest='greedy',
         help='Search frequent patterns with greedy strategy.'
     )
+    parser.add_argument(
+        '--pattern-miner',
+        type=str,
+        choices=[StructTree.SUFFIX_ARRAY_MINER, StructTree.SUFFIX_TREE_MINER, StructTree.SHARDED_SUFFIX_ARRAY_MINER],
+        default=StructTree.SUFFIX_ARRAY_MINER,
+        help='The index used to mine frequent patterns, should be one of "suffix-array", "suffix-tree" and "sharded-suffix-array", which searches the suffix array of large pages in worker processes. All find the same patterns. Defaults to "suffix-array".'
+    )
+    parser.add_argument('--mining-workers', type=int, default=os.cpu_count(), help='Number of worker processes of the sharded-suffix-array miner. Default to the number of CPUs.')
+    parser.add_argument(
+        '--pruned-mining',
+        action='store_true',
+        help='Mine frequent patterns over the node sequence without the nodes whose encoding is rarer than the frequency threshold. Finds the same patterns, the sequence is only shorter on pages with many one-off nodes.'
+    )
+    parser.add_argument(
+        '--mining-height-thresh',
+        type=int,
+        default=1,
+        help='Mine frequent patterns over the nodes of this height or more only, 2 leaves out the leaves. A shorter sequence to mine, but other patterns and records. Default to 1, all nodes.'
+    )
+    parser.add_argument(
+        '--max-nodes',
+        type=int,
+        help='Budget of the length of the node sequence mined for each page. Longer pages are mined over the pruned sequence, or else over the nodes of the lowest height that fit, which finds fewer records. No limit by default.'
+    )
+    parser.add_argument(
+        '--max-patterns',
+        type=int,
+        help='Budget of frequent patterns for each page. Beyond it, only the patterns with the most occurrences are kept. No limit by default.'
+    )
+    parser.add_argument(
+        '--max-occurrences',
+        type=int,
+        help='Budget of occurrences of the selected patterns for each page. Beyond it, patterns are dropped until the occurrences fit. No limit by default.'
+    )
+    parser.add_argument(
+        '--time-budget',
+        type=float,
+        help='Seconds of record extraction for each page. A page whose full extraction runs out of the time left by --fallback-share moves to cheaper strategies. No limit by default.'
+    )
+    parser.add_argument(
+        '--fallback-share',
+        type=float,
+        default=0.25,
+        help='Share of --time-budget kept for the cheaper strategies when the full extraction runs out of time, 0 gives the full extraction all of it and no records past it. Default to 0.25.'
+    )
+    parser.add_argument(
+        '--stats-json',
+        type=str,
+        help='Write the stage timings and pattern statistics of the extraction to this JSON file, one JSON line per page in batch mode.'
+    )
+    parser.add_argument(
+        '--template-cache',
+        type=str,
+        help='Folder of the site template cache. Pages of a site whose template is cached skip frequent pattern mining. No cache by default.'
+    )
+    parser.add_argument(
+        '--template-cache-size',
+        type=int,
+        default=1000,
+        help='Maximum number of sites kept in the template cache. Default to 1000.'
+    )
+    parser.add_argument(
+        '--site',
+        type=str,
+        help='Site key of the template cache. Default to the name of the folder of each input file.'
+    )
+    parser.add_argument(
+        '--tree-cache',
+        type=str,
+        help='Folder of the built trees of the input pages, keyed by their content. Pages seen before are neither parsed nor encoded again, the page is only parsed for HTML output or evaluation. No cache by default.'
+    )
+    parser.add_argument(
+        '--fingerprint-cache',
+        action='store_true',
+        help='Reuse the records of pages whose tree has the same fingerprint, that is, the same layout, from a cache in each process.'
+    )
+    parser.add_argument(
+        '--fingerprint-cache-dir',
+        type=str,
+        help='Folder that also keeps the fingerprint cache between runs and shares it between the worker processes, implies --fingerprint-cache. No folder by default.'
+    )
+    parser.add_argument(
+        '--fingerprint-cache-size',
+        type=int,
+        default=10000,
+        help='Maximum number of results kept in the fingerprint cache. Default to 10000.'
+    )
+    parser.add_argument(
+        '--output-format',
+        type=str,
+        choices=['html', 'jsonl', 'both'],
+        default='html',
+        help='Write the annotated page as HTML, the records as JSON lines next to it (the output path with a .jsonl extension), or both. Default to "html".'
+    )
+    parser.add_argument(
+        '--record-html',
+        action='store_true',
+        help='Include the outer HTML of each record in the JSON lines.'
+    )
+    parser.add_argument(
+        '--no-annotate',
+        action='store_true',
+        help='Do not write the data-height, data-size, data-index and data-depth attributes of each node into the output HTML.'
+    )
+    parser.add_argument(
+        '--sweep',
+        action='store_true',
+        help='Evaluate a grid of encodings and thresholds against the ground truth of --evaluate-xpath instead of writing outputs. Each page is parsed and its tree built once for the whole grid.'
+    )
+    parser.add_argument('--sweep-encodings', type=str, nargs='+', choices=[StructTree.STRUCT_PATTERN, StructTree.NODE_SIGNATURE_PATTERN, StructTree.HTP_PATTERN, StructTree.TAG_PATTERN], help='Encodings of the sweep. Default to all four.')
+    parser.add_argument('--sweep-len-thresh', type=int, nargs='+', help='Pattern length thresholds of the sweep. Default to --len-thresh.')
+    parser.add_argument('--sweep-freq-thresh', type=int, nargs='+', help='Pattern frequency thresholds of the sweep. Default to --freq-thresh.')
+    parser.add_argument('--sweep-record-height-thresh', type=int, nargs='+', help='Record height thresholds of the sweep. Default to --record-height-thresh.')
+    parser.add_argument('--sweep-record-size-thresh', type=int, nargs='+', help='Record size thresholds of the sweep. Default to --record-size-thresh.')
+    parser.add_argument('--sweep-greedy', action='store_true', help='Sweep both the closed and the greedy pattern search. Default to --greedy-pattern only.')
+    parser.add_argument('--sweep-output', type=str, help='Also write the sweep table to this CSV file.')
     parser.add_argument(
         '--evaluate-xpath', 
         type=str, 
         help='XPath for the ground truth of record container nodes.'
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.sweep and args.evaluate_xpath is None:
+        parser.error('--sweep needs the ground truth of --evaluate-xpath.')
+    if args.tree_cache is not None and args.template_cache is not None:
+        parser.error('--tree-cache cannot be used with --template-cache, templates encode pages with the vocabulary of their site.')
+    args.fingerprint_cache = args.fingerprint_cache or args.fingerprint_cache_dir is not None
+    if args.fingerprint_cache and args.template_cache is not None:
+        parser.error('--fingerprint-cache cannot be used with --template-cache.')
+    return args
+
+def output_name(relativePath):
+    # the annotated output of a JSON page is HTML, the name keeps the extension so that a.html and a.json do not collide
+    return relativePath + '.html' if relativePath.endswith('.json') else relativePath
+
+def records_path(outputPath):
+    return os.path.splitext(outputPath)[0] + '.jsonl'
+
+args = None
+templateCache = None
+treeCache = None
+fingerprintCache = None
+
+def site_key(inputPath):
+    return args.site or os.path.basename(os.path.dirname(os.path.abspath(inputPath)))
+
+def evaluate(sTree, golden, recordGroups, mark = True):
+    """
+    Count the hit, missed and mistaken record texts of recordGroups against the ground truth elements golden, and mark
+    them in the DOM if mark is set. Texts are compared by sTree.textHashes, so sTree needs to be built with text_hash.
+    """
+    textHashes = sTree.textHashes
+    annotatedTexts = set(textHashes[sTree.elementIndexes[e]] for e in golden)
+
+    # only evaluate records regions that have intersection with ground truth
+    detectedIndexes = set()
+    for recordIndexes in recordGroups:
+        groupTexts = set(textHashes[i] for i in recordIndexes)
+        if len(groupTexts.intersection(annotatedTexts)) > 0:
+            detectedIndexes.update(set(recordIndexes))
+
+    hit = set()
+    miss = set()
+    mistake = set()
+    detectedTexts = set()
+    for i in detectedIndexes:
+        t = textHashes[i]
+        detectedTexts.add(t)
+        if t == -1: # empty text
+            continue
+        if t in annotatedTexts:
+            if mark:
+                sTree[i].elm.attrib["style"] = "border: dashed darkgreen;"
+                sTree[i].elm.attrib["data-record-hit"] = "1"
+            hit.add(t)
+        else:
+            if mark:
+                sTree[i].elm.attrib["style"] = "border: dashed yellow;"
+                sTree[i].elm.attrib["data-record-mistake"] = "1"
+            mistake.add(t)
+    for e in golden:
+        t = textHashes[sTree.elementIndexes[e]]
+        if t == -1:
+            continue
+        if t not in detectedTexts:
+            if mark:
+                e.attrib["style"] = "border: dashed red;"
+                e.attrib["data-record-miss"] = "1"
+            miss.add(t)
+    return len(hit), len(miss), len(mistake)
 
-def elm2text(e):
-    textElm = [x for x in e.xpath('descendant-or-self::*[@data-index]') if x.text is not None] # only consider elements that are touched
-    return ' '.join([x.text.strip() for x in textElm]).strip()
+def input_format(inputPath):
+    """The format of the input page from --input-format or its extension, None to sniff it from the content."""
+    return args.input_format or path_format(inputPath)
 
-args = get_args()
+def page_tree(inputPath, stats: ExtractionStats = None, **kwargs):
+    """The StructTree of the input page, from the tree cache if there is one."""
+    format = input_format(inputPath)
+    if treeCache is not None:
+        # cached trees always carry the text hashes
+        kwargs.pop('text_hash', None)
+        return cached_tree(inputPath, treeCache, format=format, encoding='utf-8', stats=stats, pattern_miner=args.pattern_miner, pruned_mining=args.pruned_mining, mining_height_thresh=args.mining_height_thresh, **kwargs)
+    def parse():
+        with open(inputPath, 'rb') as file:
+            with (stats.stage('build_lxml_tree') if stats is not None else nullcontext()):
+                return build_lxml_tree(file, format=format, encoding='utf-8')
 
-def run_one(inputPath, outputPath, evaluate_xpath = None):
+    with open(inputPath, 'rb') as file:
+        if (format or sniff_format(file.read(64))) == 'json':
+            # JSON is encoded without the DOM, it is only converted to one for the HTML output and the evaluation
+            file.seek(0)
+            try:
+                return StructTree.from_json(file, elm_loader=parse, stats=stats, pattern_miner=args.pattern_miner, pruned_mining=args.pruned_mining, mining_height_thresh=args.mining_height_thresh, **kwargs)
+            except ValueError:
+                # HTML that starts with [ or { looks like JSON
+                if format is not None:
+                    raise
+    return StructTree(parse(), stats=stats, pattern_miner=args.pattern_miner, pruned_mining=args.pruned_mining, mining_height_thresh=args.mining_height_thresh, **kwargs)
+
+def extraction_budget():
+    """The ExtractionBudget of the budget options, None if none is set."""
+    budget = ExtractionBudget(args.max_nodes, args.max_patterns, args.max_occurrences, args.time_budget, args.fallback_share)
+    return None if budget == ExtractionBudget() else budget
+
+def run_one(inputPath, outputPath, evaluate_xpath = None, stats: ExtractionStats = None):
+    """Return the (hit, miss, mistake) counts of the evaluation and the strategy of the extraction."""
     hitCnt = missCnt = mistakeCnt = 0
-    with open(inputPath, encoding='utf-8') as file:
-        eTree = build_lxml_tree(file.read())
-        if evaluate_xpath is not None:
-            golden = eTree.xpath(evaluate_xpath)
-            if len(golden) == 0:
-                print('No element found using the XPath {evaluate_xpath} for {inputPath}.')
-                return -1, -1, -1
-        sTree = StructTree(eTree, pattern_method=args.encoding)
+    if templateCache is not None:
+        with open(inputPath, 'rb') as file:
+            with (stats.stage('build_lxml_tree') if stats is not None else nullcontext()):
+                eTree = build_lxml_tree(file, format=input_format(inputPath), encoding='utf-8')
+    else:
+        sTree = page_tree(inputPath, stats=stats, pattern_method=args.encoding, text_hash=evaluate_xpath is not None)
+    if evaluate_xpath is not None:
+        # the DOM of a cached tree is parsed here, it is needed for the ground truth
+        golden = (eTree if templateCache is not None else sTree.elm).xpath(evaluate_xpath)
+        if len(golden) == 0:
+            print('No element found using the XPath {evaluate_xpath} for {inputPath}.')
+            return -1, -1, -1, None
+    if templateCache is not None:
+        recordGroups, sTree, _ = extract_with_template(
+            eTree, templateCache, site_key(inputPath),
+            lenThresh=args.len_thresh,
+            freqThresh=args.freq_thresh,
+            recordHeightThresh=args.record_height_thresh,
+            recordSizeThresh=args.record_size_thresh,
+            greedyPattern=(args.greedy),
+            pattern_method=args.encoding,
+            pattern_miner=args.pattern_miner,
+            stats=stats,
+            text_hash=evaluate_xpath is not None,
+            pruned_mining=args.pruned_mining,
+            mining_height_thresh=args.mining_height_thresh,
+            budget=extraction_budget(),
+        )
+    elif fingerprintCache is not None:
+        recordGroups, _ = extract_with_fingerprint(
+            sTree, fingerprintCache,
+            lenThresh=args.len_thresh,
+            freqThresh=args.freq_thresh,
+            recordHeightThresh=args.record_height_thresh,
+            recordSizeThresh=args.record_size_thresh,
+            greedyPattern=(args.greedy),
+            budget=extraction_budget(),
+        )
+    else:
         recordGroups = sTree.record_boundary(
             lenThresh=args.len_thresh, 
             freqThresh=args.freq_thresh, 
             recordHeightThresh=args.record_height_thresh, 
             recordSizeThresh=args.record_size_thresh, 
             greedyPattern=(args.greedy),
+            budget=extraction_budget(),
         )
-        if evaluate_xpath is None:
+    writeHTML = args.output_format in ['html', 'both']
+    if writeHTML and not args.no_annotate:
+        sTree.annotate()
+    if evaluate_xpath is None:
+        if writeHTML:
             for i, recordIndexes in enumerate(recordGroups):
                 for i in recordIndexes:
                     sTree[i].elm.attrib["data-record-{i}"] = ""
                     sTree[i].elm.attrib["style"] = "border: dashed darkgreen;"
-        else:
-            index2text = {}
-            annotatedTexts = set()
-            for e in golden:
-                t = elm2text(e)
-                index2text[int(e.attrib['data-index'])] = t
-                annotatedTexts.add(t)
-
-            # only evaluate records regions that have intersection with ground truth
-            detectedIndexes = set()
-            for recordIndexes in recordGroups:
-                groupTexts = set()
-                for i in recordIndexes:
-                    e = sTree[i].elm
-                    t = elm2text(e)
-                    index2text[i] = t
-                    groupTexts.add(t)
-                if len(groupTexts.intersection(annotatedTexts)) > 0:
-                    detectedIndexes.update(set(recordIndexes))
-            
-            hit = set()
-            miss = set()
-            mistake = set()
-            detectedTexts = set()
-            for i in detectedIndexes:
-                t = index2text[i]
-                detectedTexts.add(t)
-                if len(t) == 0:
-                    continue
-                if t in annotatedTexts:
-                    sTree[i].elm.attrib["style"] = "border: dashed darkgreen;"
-                    sTree[i].elm.attrib["data-record-hit"] = "1"
-                    hit.add(t)
-                else:
-                    sTree[i].elm.attrib["style"] = "border: dashed yellow;"
-                    sTree[i].elm.attrib["data-record-mistake"] = "1"
-                    mistake.add(t)
-            for e in golden:
-                t = index2text[int(e.attrib['data-index'])]
-                if len(t) == 0:
-                    continue
-                if t not in detectedTexts:
-                    e.attrib["style"] = "border: dashed red;"
-                    e.attrib["data-record-miss"] = "1"
-                    miss.add(t)
-            hitCnt = len(hit)
-            missCnt = len(miss)
-            mistakeCnt = len(mistake)
-            if mistakeCnt > 10:
-                print(inputPath)
-        with open(outputPath, 'wb') as f:
-            f.write(html.tostring(eTree, pretty_print=True, encoding='utf-8'))
-        return hitCnt, missCnt, mistakeCnt
+    else:
+        hitCnt, missCnt, mistakeCnt = evaluate(sTree, golden, recordGroups)
+        if mistakeCnt > 10:
+            print(inputPath)
+    with (stats.stage('serialize') if stats is not None else nullcontext()):
+        if writeHTML:
+            with open(outputPath, 'wb') as f:
+                f.write(html.tostring(sTree.elm, pretty_print=True, encoding='utf-8'))
+        if args.output_format in ['jsonl', 'both']:
+            with open(records_path(outputPath), 'w', encoding='utf-8') as f:
+                for record in iter_records(sTree, recordGroups, outerHTML=args.record_html):
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return hitCnt, missCnt, mistakeCnt, sTree.strategy
+
+def sweep_configs():
+    return [ExtractionConfig(*c) for c in itertools.product(
+        args.sweep_encodings or [StructTree.STRUCT_PATTERN, StructTree.NODE_SIGNATURE_PATTERN, StructTree.HTP_PATTERN, StructTree.TAG_PATTERN],
+        args.sweep_len_thresh or [args.len_thresh],
+        args.sweep_freq_thresh or [args.freq_thresh],
+        args.sweep_record_height_thresh or [args.record_height_thresh],
+        args.sweep_record_size_thresh or [args.record_size_thresh],
+        [False, True] if args.sweep_greedy else [args.greedy],
+    )]
+
+def sweep_one(inputPath, evaluate_xpath, stats: ExtractionStats = None):
+    """The (hit, miss, mistake) counts of every sweep config on one page, or None if the page has no ground truth."""
+    sTree = page_tree(inputPath, stats=stats, text_hash=True)
+    golden = sTree.elm.xpath(evaluate_xpath)
+    if len(golden) == 0:
+        return None
+    return [evaluate(sTree, golden, recordGroups, mark=False) for _, recordGroups in sTree.sweep(sweep_configs())]
+
+def init_worker(workerArgs):
+    global args, templateCache, treeCache, fingerprintCache
+    args = workerArgs
+    ShardedSuffixArray.workers = args.mining_workers
+    # each worker keeps its own LRU, the folder is shared between them
+    if args.template_cache is not None:
+        templateCache = TemplateCache(args.template_cache, maxSites=args.template_cache_size)
+    if args.tree_cache is not None:
+        treeCache = TreeCache(args.tree_cache)
+    if args.fingerprint_cache:
+        fingerprintCache = FingerprintCache(args.fingerprint_cache_dir, maxEntries=args.fingerprint_cache_size)
+
+def run_page(inputPath, outputPath, evaluate_xpath = None, timeout = None, collectStats = False):
+    """Run one page of a batch in a worker process and report the outcome instead of raising."""
+    result = {'input': inputPath, 'output': outputPath, 'status': 'ok'}
+    if args.output_format != 'html' and outputPath is not None:
+        result['records'] = records_path(outputPath)
+    start = time.perf_counter()
+    try:
+        with page_timeout(timeout):
+            if outputPath is not None:
+                os.makedirs(os.path.dirname(outputPath) or '.', exist_ok=True)
+            stats = ExtractionStats() if collectStats else None
+            hits = templateCache.hits if templateCache is not None else 0
+            treeHits = treeCache.hits if treeCache is not None else 0
+            fingerprintHits = fingerprintCache.hits if fingerprintCache is not None else 0
+            if args.sweep:
+                result['configs'] = sweep_one(inputPath, evaluate_xpath, stats=stats)
+            else:
+                result['hit'], result['miss'], result['mistake'], result['strategy'] = run_one(inputPath, outputPath, evaluate_xpath=evaluate_xpath, stats=stats)
+            if templateCache is not None:
+                result['template_hit'] = templateCache.hits > hits
+            if treeCache is not None:
+                result['tree_hit'] = treeCache.hits > treeHits
+            if fingerprintCache is not None and not args.sweep:
+                result['fingerprint_hit'] = fingerprintCache.hits > fingerprintHits
+            if stats is not None:
+                result['stats'] = stats.to_dict()
+    except PageTimeout:
+        result['status'] = 'timeout'
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = repr(e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def list_inputs(input, format: str = None):
+    """Return the input files and the folder their output paths are relative to. A folder gives its pages of format, HTML and JSON by default."""
+    if os.path.isdir(input):
+        formats = INPUT_FORMATS if format is None else [format]
+        return sorted(p for f in formats for p in glob.glob(os.path.join(input, '**', f'*.{f}'), recursive=True)), input
+    if os.path.isfile(input):
+        with open(input, encoding='utf-8') as file:
+            inputPaths = [line.strip() for line in file if len(line.strip()) > 0]
+    else:
+        inputPaths = sorted(glob.glob(input, recursive=True))
+    if len(inputPaths) == 0:
+        return [], '.'
+    return inputPaths, os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in inputPaths])
+
+def run_batch(jobs):
+    """
+    Run (inputPath, outputPath) jobs over a process pool and yield the result of each page as it completes.
+    At most args.max_in_flight pages are submitted at a time. If a worker dies, the pool is replaced and
+    the pages that were in flight are re-run one at a time, so only the page that kills a worker fails.
+    """
+    pending = deque(jobs)
+    maxInFlight = args.max_in_flight or 2 * args.workers
+    while len(pending) > 0:
+        suspects = []
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(args,)) as executor:
+            inFlight = {}
+            while len(suspects) == 0 and (len(pending) > 0 or len(inFlight) > 0):
+                try:
+                    while len(pending) > 0 and len(inFlight) < maxInFlight:
+                        job = pending.popleft()
+                        inFlight[executor.submit(run_page, *job, args.evaluate_xpath, args.timeout, args.stats_json is not None)] = job
+                except BrokenProcessPool:
+                    pending.appendleft(job)
+                done, _ = wait(inFlight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = inFlight.pop(future)
+                    try:
+                        yield future.result()
+                    except BrokenProcessPool:
+                        suspects.append(job)
+            if len(suspects) > 0:
+                # the broken pool fails every page in flight
+                for future in wait(inFlight).done:
+                    try:
+                        yield future.result()
+                    except BrokenProcessPool:
+                        suspects.append(inFlight[future])
+        for job in suspects:
+            with ProcessPoolExecutor(max_workers=1, initializer=init_worker, initargs=(args,)) as executor:
+                try:
+                    yield executor.submit(run_page, *job, args.evaluate_xpath, args.timeout, args.stats_json is not None).result()
+                except BrokenProcessPool:
+                    yield {'input': job[0], 'output': job[1], 'status': 'crashed', 'seconds': None}
+
+def main_batch():
+    inputPaths, inputRoot = list_inputs(args.input, args.input_format)
+    jobs = [(p, os.path.join(args.output_dir, output_name(os.path.relpath(os.path.abspath(p), inputRoot)))) for p in inputPaths]
+    start = time.perf_counter()
+    statusCnt = {}
+    latencies = []
+    hitCnt = missCnt = mistakeCnt = 0
+    templateHitCnt = 0
+    treeHitCnt = 0
+    fingerprintHitCnt = 0
+    strategyCnt = {}
+    statsFile = open(args.stats_json, 'w', encoding='utf-8') if args.stats_json is not None else None
+    for result in run_batch(jobs):
+        if 'stats' in result:
+            statsFile.write(json.dumps(dict(input=result['input'], **result.pop('stats'))) + '\n')
+        print(json.dumps(result), flush=True)
+        statusCnt[result['status']] = statusCnt.get(result['status'], 0) + 1
+        if result['seconds'] is not None:
+            latencies.append(result['seconds'])
+        templateHitCnt += result.get('template_hit', False)
+        treeHitCnt += result.get('tree_hit', False)
+        fingerprintHitCnt += result.get('fingerprint_hit', False)
+        if result.get('strategy') is not None:
+            strategyCnt[result['strategy']] = strategyCnt.get(result['strategy'], 0) + 1
+        if result['status'] == 'ok' and result['hit'] >= 0:
+            hitCnt += result['hit']
+            missCnt += result['miss']
+            mistakeCnt += result['mistake']
+    if statsFile is not None:
+        statsFile.close()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"Processed {len(jobs)} pages in {elapsed:.2f} s ({0 if elapsed == 0 else len(jobs) / elapsed:.2f} pages/s), " +
+        f"latency p50 = {percentile(latencies, 0.5):.3f} s, p95 = {percentile(latencies, 0.95):.3f} s, p99 = {percentile(latencies, 0.99):.3f} s, " +
+        ', '.join(f'{k} = {v}' for k, v in sorted(statusCnt.items())) + '.', file=sys.stderr)
+    if args.template_cache is not None:
+        print(f"Template cache hit rate = {0 if len(jobs) == 0 else templateHitCnt / len(jobs):.2f} ({templateHitCnt} of {len(jobs)} pages).", file=sys.stderr)
+    if args.tree_cache is not None:
+        print(f"Tree cache hit rate = {0 if len(jobs) == 0 else treeHitCnt / len(jobs):.2f} ({treeHitCnt} of {len(jobs)} pages).", file=sys.stderr)
+    if args.fingerprint_cache:
+        print(f"Fingerprint cache hit rate = {0 if len(jobs) == 0 else fingerprintHitCnt / len(jobs):.2f} ({fingerprintHitCnt} of {len(jobs)} pages).", file=sys.stderr)
+    if extraction_budget() is not None:
+        print('Extraction strategies: ' + ', '.join(f'{k} = {v}' for k, v in sorted(strategyCnt.items())) + '.', file=sys.stderr)
+    if args.evaluate_xpath is not None:
+        print(f"Results on {args.input}: Recall = {0 if (hitCnt + missCnt) == 0 else hitCnt/(hitCnt + missCnt):.2f}, precision = {0 if (hitCnt + mistakeCnt) == 0 else hitCnt/ (hitCnt + mistakeCnt):.2f}.", file=sys.stderr)
+
+def main_sweep():
+    if os.path.isfile(args.input) and args.input.split('.')[-1] in ['html', 'json']:
+        inputPaths = [args.input]
+    else:
+        inputPaths, _ = list_inputs(args.input, args.input_format)
+    configs = sweep_configs()
+    counts = [[0, 0, 0] for _ in configs]
+    start = time.perf_counter()
+    statusCnt = {}
+    statsFile = open(args.stats_json, 'w', encoding='utf-8') if args.stats_json is not None else None
+    for result in run_batch([(p, None) for p in inputPaths]):
+        if 'stats' in result:
+            statsFile.write(json.dumps(dict(input=result['input'], **result.pop('stats'))) + '\n')
+        statusCnt[result['status']] = statusCnt.get(result['status'], 0) + 1
+        if result['status'] != 'ok':
+            print(json.dumps(result), file=sys.stderr, flush=True)
+        elif result['configs'] is not None:
+            for total, pageCounts in zip(counts, result['configs']):
+                for k in range(3):
+                    total[k] += pageCounts[k]
+    if statsFile is not None:
+        statsFile.close()
+    header = ['encoding', 'len_thresh', 'freq_thresh', 'record_height_thresh', 'record_size_thresh', 'greedy', 'hit', 'miss', 'mistake', 'precision', 'recall', 'f1']
+    rows = []
+    for config, (hitCnt, missCnt, mistakeCnt) in zip(configs, counts):
+        recall = 0 if (hitCnt + missCnt) == 0 else hitCnt / (hitCnt + missCnt)
+        precision = 0 if (hitCnt + mistakeCnt) == 0 else hitCnt / (hitCnt + mistakeCnt)
+        f1 = 0 if (precision + recall) == 0 else 2 * precision * recall / (precision + recall)
+        rows.append(list(config) + [hitCnt, missCnt, mistakeCnt, round(precision, 4), round(recall, 4), round(f1, 4)])
+    print(' '.join(f'{h:>10}' for h in header))
+    for row in rows:
+        print(' '.join(f'{str(x):>10}' for x in row))
+    if args.sweep_output is not None:
+        with open(args.sweep_output, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(header)
+            writer.writerows(rows)
+    print(f"Swept {len(configs)} configurations over {len(inputPaths)} pages in {time.perf_counter() - start:.2f} s, " +
+        ', '.join(f'{k} = {v}' for k, v in sorted(statusCnt.items())) + '.', file=sys.stderr)
 
 if __name__ == '__main__':
-    assert os.path.isfile(args.input) and args.input.split('.')[-1] == 'html', "Expecting input to be an HTML file, or a folder containing HTML files."
-    hitCnt, missCnt, mistakeCnt = run_one(args.input, args.output, evaluate_xpath=args.evaluate_xpath)
+    args = get_args()
+    ShardedSuffixArray.workers = args.mining_workers
+    if args.sweep:
+        main_sweep()
+        sys.exit(0)
+    if not (os.path.isfile(args.input) and args.input.split('.')[-1] in ['html', 'json']):
+        main_batch()
+        sys.exit(0)
+    if args.template_cache is not None:
+        templateCache = TemplateCache(args.template_cache, maxSites=args.template_cache_size)
+    if args.tree_cache is not None:
+        treeCache = TreeCache(args.tree_cache)
+    if args.fingerprint_cache:
+        fingerprintCache = FingerprintCache(args.fingerprint_cache_dir, maxEntries=args.fingerprint_cache_size)
+    stats = ExtractionStats() if args.stats_json is not None else None
+    hitCnt, missCnt, mistakeCnt, strategy = run_one(args.input, args.output, evaluate_xpath=args.evaluate_xpath, stats=stats)
+    if strategy not in [None, StructTree.FULL_STRATEGY]:
+        print(f'The extraction went over its budget and used the {strategy} strategy.', file=sys.stderr)
+    if stats is not None:
+        with open(args.stats_json, 'w', encoding='utf-8') as file:
+            json.dump(dict(input=args.input, **stats.to_dict()), file)
     if args.evaluate_xpath is not None:
         print(f"Results on {args.input}: Recall = {0 if (hitCnt + missCnt) == 0 else hitCnt/(hitCnt + missCnt):.2f}, precision = {0 if (hitCnt + mistakeCnt) == 0 else hitCnt/ (hitCnt + mistakeCnt):.2f}.")
-
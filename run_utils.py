@@ -0,0 +1,49 @@
+import signal
+from contextlib import contextmanager
+from lxml import html
+
+class PageTimeout(Exception):
+    """Raised by page_timeout when the page in progress runs past its time limit."""
+
+@contextmanager
+def page_timeout(seconds: float = None):
+    """
+    Raise PageTimeout in the block once it has run for seconds, None for no limit. The timer is SIGALRM, so it only
+    works in the main thread, and it interrupts Python code only, a page stuck inside a single lxml call is stopped
+    once the call returns.
+    """
+    if seconds is None:
+        yield
+        return
+    if seconds <= 0:
+        raise PageTimeout()
+    def raise_page_timeout(signum, frame):
+        raise PageTimeout()
+    previous = signal.signal(signal.SIGALRM, raise_page_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def percentile(sortedValues, q):
+    """The value at quantile q of sortedValues, 0 if there is none."""
+    if len(sortedValues) == 0:
+        return 0
+    return sortedValues[min(len(sortedValues) - 1, int(q * len(sortedValues)))]
+
+def iter_records(sTree, recordGroups, outerHTML = False):
+    """
+    Yield one dict per record container straight from the record_boundary result, without serializing the page.
+    Groups are numbered in sorted order, so the numbers do not depend on how the set was built. Records of a tree
+    built from JSON also have their JSON pointer into the document.
+    """
+    for groupID, recordIndexes in enumerate(sorted(recordGroups)):
+        for i in recordIndexes:
+            record = {'group': groupID, 'index': i, 'xpath': sTree.node_path(i), 'text': ' '.join(sTree.text_content(i).split())}
+            if sTree.jsonSteps is not None:
+                record['pointer'] = sTree.json_pointer(i)
+            if outerHTML:
+                record['html'] = html.tostring(sTree.elements[i], encoding='unicode', with_tail=False)
+            yield record
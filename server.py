@@ -0,0 +1,289 @@
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from univeral_tree import build_lxml_tree, sniff_format, StructTree, ExtractionStats, ExtractionConfig, ExtractionBudget, INPUT_FORMATS
+from run_utils import iter_records, percentile, page_timeout, PageTimeout
+from fingerprint_cache import FingerprintCache, extract_with_fingerprint
+
+ENCODINGS = [StructTree.STRUCT_PATTERN, StructTree.NODE_SIGNATURE_PATTERN, StructTree.HTP_PATTERN, StructTree.TAG_PATTERN]
+WARM_UP_PAGE = '<ul>' + '<li><a href="#">title</a><span>text</span></li>' * 5 + '</ul>'
+
+fingerprintCache = None
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve record extraction over HTTP on localhost from a pool of warm worker processes.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on. Default to "127.0.0.1".')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on. Default to 8000.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes. Default to the number of CPUs.')
+    parser.add_argument('--max-in-flight', type=int, help='Maximum number of pages being extracted or waiting for a worker, further requests get 503. Default to twice the number of workers.')
+    parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait for the extraction of a page before answering 504. Default to 60.')
+    parser.add_argument('--max-body-bytes', type=int, default=64 << 20, help='Largest accepted page in bytes, larger requests get 413. Default to 64 MiB.')
+    parser.add_argument('--encoding', type=str, choices=ENCODINGS, default=StructTree.STRUCT_PATTERN, help='Default encoding of a request. Defaults to "structure".')
+    parser.add_argument('--len-thresh', type=int, default=3, help='Default pattern length threshold of a request. Default to 3.')
+    parser.add_argument('--freq-thresh', type=int, default=3, help='Default pattern frequency threshold of a request. Default to 3.')
+    parser.add_argument('--record-height-thresh', type=int, default=2, help='Default subtree height threshold for target records of a request. Default to 2.')
+    parser.add_argument('--record-size-thresh', type=int, default=2, help='Default subtree size threshold for target records of a request. Default to 2.')
+    parser.add_argument('--pattern-miner', type=str, choices=list(StructTree.PATTERN_MINERS), default=StructTree.SUFFIX_ARRAY_MINER, help='The frequent pattern miner. Default to "suffix-array".')
+    parser.add_argument('--pruned-mining', action='store_true', help='Mine frequent patterns over the pruned node sequence.')
+    parser.add_argument('--mining-height-thresh', type=int, default=1, help='Mine frequent patterns over the nodes of this height or more only. Default to 1, all nodes.')
+    parser.add_argument('--max-nodes', type=int, help='Budget of the length of the mined node sequence of a page, longer pages are mined over fewer nodes. No limit by default.')
+    parser.add_argument('--max-patterns', type=int, help='Budget of frequent patterns of a page. No limit by default.')
+    parser.add_argument('--max-occurrences', type=int, help='Budget of occurrences of the selected patterns of a page. No limit by default.')
+    parser.add_argument('--time-budget', type=float, help='Seconds of record extraction of a page, keep it below --timeout. No limit by default.')
+    parser.add_argument('--fallback-share', type=float, default=0.25, help='Share of --time-budget kept for the cheaper strategies when the full extraction runs out of time, 0 gives the full extraction all of it. Default to 0.25.')
+    parser.add_argument('--fingerprint-cache', action='store_true', help='Reuse the records of pages with the same layout from a cache in each worker.')
+    parser.add_argument('--fingerprint-cache-dir', type=str, help='Folder that also keeps the fingerprint cache between runs and shares it between the workers, implies --fingerprint-cache. No folder by default.')
+    parser.add_argument('--fingerprint-cache-size', type=int, default=10000, help='Maximum number of results kept in the fingerprint cache. Default to 10000.')
+    args = parser.parse_args(argv)
+    args.fingerprint_cache = args.fingerprint_cache or args.fingerprint_cache_dir is not None
+    return args
+
+def warm_up(fingerprintCacheDir: str = None, fingerprintCacheSize: int = None):
+    # run the whole pipeline once in each worker, so the first request does not pay for imports and first calls
+    global fingerprintCache
+    StructTree(build_lxml_tree(WARM_UP_PAGE)).record_boundary(3, 3, 2, 2)
+    if fingerprintCacheSize is not None:
+        fingerprintCache = FingerprintCache(fingerprintCacheDir, maxEntries=fingerprintCacheSize)
+
+def extract(source: bytes, format: str, charset: str, config: ExtractionConfig, recordHTML: bool, pattern_miner: str, pruned_mining: bool, mining_height_thresh: int, budget: ExtractionBudget = None, deadline: float = None) -> dict:
+    """
+    Run record_boundary on one page in a worker process and return the records, the strategy used and whether the
+    fingerprint cache had them as JSON-ready dicts. deadline is the time.time() at which the request times out, the
+    worker gives up the page then with PageTimeout, so it is free for the next one.
+    """
+    with page_timeout(None if deadline is None else deadline - time.time()):
+        stats = ExtractionStats()
+        sTree = None
+        if (format or sniff_format(source)) == 'json':
+            # the DOM is only built for the outer HTML of the records
+            try:
+                sTree = StructTree.from_json(source, elm_loader=lambda: build_lxml_tree(source, format='json'), pattern_method=config.patternMethod, pattern_miner=pattern_miner, stats=stats, pruned_mining=pruned_mining, mining_height_thresh=mining_height_thresh)
+            except ValueError:
+                # HTML that starts with [ or { looks like JSON
+                if format is not None:
+                    raise
+        if sTree is None:
+            with stats.stage('build_lxml_tree'):
+                eTree = build_lxml_tree(source, format=format, encoding=charset)
+            sTree = StructTree(eTree, pattern_method=config.patternMethod, pattern_miner=pattern_miner, stats=stats, pruned_mining=pruned_mining, mining_height_thresh=mining_height_thresh)
+        fingerprintHit = False
+        if fingerprintCache is not None:
+            recordGroups, fingerprintHit = extract_with_fingerprint(sTree, fingerprintCache, config.lenThresh, config.freqThresh, config.recordHeightThresh, config.recordSizeThresh, greedyPattern=config.greedyPattern, budget=budget)
+        else:
+            recordGroups = sTree.record_boundary(config.lenThresh, config.freqThresh, config.recordHeightThresh, config.recordSizeThresh, greedyPattern=config.greedyPattern, budget=budget)
+        return {'nodes': len(sTree), 'strategy': sTree.strategy, 'fingerprint_hit': fingerprintHit, 'records': list(iter_records(sTree, recordGroups, outerHTML=recordHTML)), 'stats': stats.to_dict()}
+
+class RequestError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+class ExtractionService:
+    """
+    The worker pool behind the HTTP handler. At most maxInFlight pages are accepted at a time, running or waiting for
+    a worker, a page is counted until its worker is done with it. The worker gives up a page when its request times
+    out, or skips it if the page was still waiting. If a worker dies, the pool is replaced and only the requests in
+    flight fail.
+    """
+    def __init__(self, args) -> None:
+        self.args = args
+        self.maxInFlight = args.max_in_flight or 2 * args.workers
+        self.slots = threading.BoundedSemaphore(self.maxInFlight)
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counts = {'requests': 0, 'ok': 0, 'bad_request': 0, 'rejected': 0, 'timeout': 0, 'error': 0, 'degraded': 0, 'fingerprint_hits': 0, 'fingerprint_misses': 0}
+        self.inFlight = 0
+        self.latencies = deque(maxlen=10000) # seconds of the latest successful requests
+        self.budget = ExtractionBudget(args.max_nodes, args.max_patterns, args.max_occurrences, args.time_budget, args.fallback_share)
+        self.executor = self._start_pool()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        cacheArgs = (self.args.fingerprint_cache_dir, self.args.fingerprint_cache_size) if self.args.fingerprint_cache else ()
+        return ProcessPoolExecutor(max_workers=self.args.workers, initializer=warm_up, initargs=cacheArgs)
+
+    def _start_pool(self) -> ProcessPoolExecutor:
+        executor = self._new_pool()
+        wait([executor.submit(os.getpid) for _ in range(self.args.workers)])
+        return executor
+
+    def _count(self, key: str):
+        with self.lock:
+            self.counts[key] += 1
+
+    def _release(self, _):
+        with self.lock:
+            self.inFlight -= 1
+        self.slots.release()
+
+    def config(self, query: dict) -> ExtractionConfig:
+        """The extraction settings of a request from its query string, the server options fill in the rest."""
+        def get(name, default, convert=int):
+            if name not in query:
+                return default
+            try:
+                return convert(query[name][-1])
+            except ValueError:
+                raise RequestError(400, f'Invalid value of {name}: {query[name][-1]}.')
+        encoding = get('encoding', self.args.encoding, str)
+        if encoding not in ENCODINGS:
+            raise RequestError(400, f'Unknown encoding {encoding}, should be one of {", ".join(ENCODINGS)}.')
+        return ExtractionConfig(
+            encoding,
+            get('len_thresh', self.args.len_thresh),
+            get('freq_thresh', self.args.freq_thresh),
+            get('record_height_thresh', self.args.record_height_thresh),
+            get('record_size_thresh', self.args.record_size_thresh),
+            get('greedy', False, lambda v: v.lower() in ['1', 'true', 'yes']),
+        )
+
+    def extract(self, source: bytes, query: dict, charset: str) -> dict:
+        config = self.config(query)
+        format = query.get('format', [None])[-1]
+        if format is not None and format not in INPUT_FORMATS:
+            raise RequestError(400, f'Unknown format {format}, should be one of {", ".join(INPUT_FORMATS)}.')
+        recordHTML = query.get('record_html', ['0'])[-1].lower() in ['1', 'true', 'yes']
+        if not self.slots.acquire(blocking=False):
+            raise RequestError(503, f'{self.maxInFlight} pages are already in flight.')
+        start = time.perf_counter()
+        try:
+            with self.lock:
+                self.inFlight += 1
+                executor = self.executor
+            future = executor.submit(extract, source, format, charset, config, recordHTML, self.args.pattern_miner, self.args.pruned_mining, self.args.mining_height_thresh, self.budget, time.time() + self.args.timeout)
+        except BrokenProcessPool:
+            self._release(None)
+            self._replace_pool(executor)
+            raise RequestError(500, 'The worker pool was restarted, retry the request.')
+        future.add_done_callback(self._release)
+        try:
+            ret = future.result(timeout=self.args.timeout)
+        except (FutureTimeoutError, PageTimeout):
+            raise RequestError(504, f'The extraction took longer than {self.args.timeout} s.')
+        except BrokenProcessPool:
+            self._replace_pool(executor)
+            raise RequestError(500, 'A worker process died while extracting the page.')
+        except Exception as e:
+            raise RequestError(422, f'The page could not be extracted: {e!r}.')
+        seconds = time.perf_counter() - start
+        with self.lock:
+            self.latencies.append(seconds)
+            self.counts['degraded'] += ret['strategy'] != StructTree.FULL_STRATEGY
+            if self.args.fingerprint_cache:
+                self.counts['fingerprint_hits' if ret['fingerprint_hit'] else 'fingerprint_misses'] += 1
+        ret['seconds'] = seconds
+        return ret
+
+    def _replace_pool(self, broken: ProcessPoolExecutor):
+        with self.lock:
+            if self.executor is not broken:
+                return
+            self.executor = self._new_pool()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self) -> dict:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            ret = dict(self.counts)
+            ret['in_flight'] = self.inFlight
+        ret.update({
+            'max_in_flight': self.maxInFlight,
+            'workers': self.args.workers,
+            'uptime_seconds': time.time() - self.started,
+            'latency_p50': percentile(latencies, 0.5),
+            'latency_p95': percentile(latencies, 0.95),
+            'latency_p99': percentile(latencies, 0.99),
+            'fingerprint_hit_rate': 0 if ret['fingerprint_hits'] + ret['fingerprint_misses'] == 0 else ret['fingerprint_hits'] / (ret['fingerprint_hits'] + ret['fingerprint_misses']),
+        })
+        return ret
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+class ExtractionHandler(BaseHTTPRequestHandler):
+    """
+    POST /extract with the page as the body extracts its records, the query string may set encoding, len_thresh,
+    freq_thresh, record_height_thresh, record_size_thresh, greedy, format and record_html. GET /metrics reports the
+    request counts and latencies, GET /health answers once the workers are warm.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        if status == 503:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/metrics':
+            self._send_json(200, self.server.service.metrics())
+        elif path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': f'Unknown path {path}.'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        service = self.server.service
+        length = int(self.headers.get('Content-Length', 0))
+        if url.path != '/extract':
+            self.rfile.read(length)
+            self._send_json(404, {'error': f'Unknown path {url.path}.'})
+            return
+        service._count('requests')
+        if length > service.args.max_body_bytes:
+            service._count('rejected')
+            self.close_connection = True
+            self._send_json(413, {'error': f'The page is larger than {service.args.max_body_bytes} bytes.'})
+            return
+        source = self.rfile.read(length)
+        try:
+            ret = service.extract(source, parse_qs(url.query), self.headers.get_content_charset())
+        except RequestError as e:
+            service._count({400: 'bad_request', 503: 'rejected', 504: 'timeout'}.get(e.status, 'error'))
+            self._send_json(e.status, {'error': str(e)})
+            return
+        # counted before the answer, so /metrics right after it already has the request
+        service._count('ok')
+        self._send_json(200, ret)
+
+    def log_message(self, format, *args):
+        pass
+
+def make_server(service: ExtractionService) -> ThreadingHTTPServer:
+    """The HTTP server of service on the host and port of its options, port 0 picks a free port."""
+    server = ThreadingHTTPServer((service.args.host, service.args.port), ExtractionHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+def main(args):
+    service = ExtractionService(args)
+    server = make_server(service)
+    # serve_forever has to be stopped from another thread
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    print(f'Serving on http://{args.host}:{server.server_address[1]} with {args.workers} workers.', file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+if __name__ == '__main__':
+    main(get_args())
@@ -0,0 +1,303 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+import numpy as np
+
+class SuffixArray:
+    """
+    Suffix array + LCP array replacement of SuffixTree for frequent pattern mining.
+
+    The LCP intervals of the suffix array are exactly the internal nodes of the suffix tree, so the
+    interval tree is walked with the same search as SuffixTree.frequent_pattern. Children of an interval
+    are ordered by their leftmost occurrence, which is the order Ukkonen's construction inserts them in,
+    so both backends return the same patterns in the same order.
+    """
+    def __init__(self, s=None):
+        self.S = tuple(s) if s is not None else tuple()
+        symbol2Code = {}
+        # code 0 is the unique terminal that closes the sequence, like UniqueEndChar in suffix_tree.
+        codes = [symbol2Code.setdefault(x, len(symbol2Code) + 1) for x in self.S]
+        codes.append(0)
+        self.codes = np.array(codes, dtype=np.int64)
+        self.suffixArray = self._build_suffix_array(self.codes)
+        self.lcp = self._build_lcp(self.codes, self.suffixArray)
+        self._build_interval_tree()
+
+    @staticmethod
+    def _build_suffix_array(codes: np.ndarray) -> np.ndarray:
+        # prefix doubling, each round sorts suffixes by their first 2k symbols
+        n = len(codes)
+        rank = codes.copy()
+        k = 1
+        while True:
+            second = np.full(n, -1, dtype=np.int64)
+            second[:n - k] = rank[k:]
+            sa = np.lexsort((second, rank))
+            r, s = rank[sa], second[sa]
+            newGroup = np.empty(n, dtype=bool)
+            newGroup[0] = True
+            newGroup[1:] = (r[1:] != r[:-1]) | (s[1:] != s[:-1])
+            rank = np.empty(n, dtype=np.int64)
+            rank[sa] = np.cumsum(newGroup) - 1
+            if rank[sa[-1]] == n - 1 or k >= n:
+                return sa
+            k *= 2
+
+    @staticmethod
+    def _build_lcp(codes: np.ndarray, suffixArray: np.ndarray) -> np.ndarray:
+        # Kasai's algorithm, lcp[i] is the longest common prefix of suffixes suffixArray[i-1] and suffixArray[i]
+        n = len(codes)
+        s = codes.tolist()
+        sa = suffixArray.tolist()
+        rank = [0] * n
+        for i, p in enumerate(sa):
+            rank[p] = i
+        lcp = [0] * n
+        h = 0
+        for p in range(n):
+            r = rank[p]
+            if r == 0:
+                h = 0
+                continue
+            q = sa[r - 1]
+            while p + h < n and q + h < n and s[p + h] == s[q + h]:
+                h += 1
+            lcp[r] = h
+            if h > 0:
+                h -= 1
+        return np.array(lcp, dtype=np.int64)
+
+    def _build_interval_tree(self, lo: int = 0, hi: int = None):
+        """
+        Build the LCP interval tree bottom-up over positions lo..hi of the suffix array, all of them by default, a range
+        that starts and ends with whole root children. Internal nodes are numbered 0..m-1 in the order they close,
+        so the root is the last one. Leaves are numbered m + (position in the suffix array - lo).
+        """
+        n = len(self.codes)
+        hi = n - 1 if hi is None else hi
+        sa = self.suffixArray.tolist()
+        lcp = self.lcp.tolist()
+        depth, lb, rb, childStart, firstOccurrence = [], [], [], [0], []
+        children = []
+
+        def close(frame, right):
+            frameDepth, frameLB, frameChildren = frame
+            # children are (leftmost occurrence, internal node id or ~leaf position) pairs
+            frameChildren.sort()
+            children.extend(c for _, c in frameChildren)
+            childStart.append(len(children))
+            depth.append(frameDepth)
+            lb.append(frameLB)
+            rb.append(right)
+            firstOccurrence.append(frameChildren[0][0])
+            return len(depth) - 1
+
+        stack = [(0, lo, [])]
+        for i in range(lo + 1, hi + 2):
+            l = lcp[i] if i <= hi else 0
+            leaf = (sa[i - 1], ~(i - 1 - lo))
+            if l <= stack[-1][0]:
+                stack[-1][2].append(leaf)
+            last = None
+            while l < stack[-1][0]:
+                nodeID = close(stack.pop(), i - 1)
+                if l <= stack[-1][0]:
+                    stack[-1][2].append((firstOccurrence[nodeID], nodeID))
+                else:
+                    last = nodeID
+            if l > stack[-1][0]:
+                if last is not None:
+                    stack.append((l, lb[last], [(firstOccurrence[last], last)]))
+                else:
+                    stack.append((l, i - 1, [leaf]))
+        self.root = close(stack.pop(), hi)
+        m = len(depth)
+        self.internalCnt = m
+        self.leafStart = lo
+        self.depth = np.array(depth, dtype=np.int64)
+        self.leafCnt = np.concatenate([np.array(rb, dtype=np.int64) - np.array(lb, dtype=np.int64) + 1, np.ones(hi - lo + 1, dtype=np.int64)])
+        self.childStart = np.array(childStart, dtype=np.int64)
+        self.children = np.array([c if c >= 0 else m + ~c for c in children], dtype=np.int64)
+        self.lb = np.array(lb, dtype=np.int64)
+        self.firstOccurrence = np.array(firstOccurrence, dtype=np.int64)
+
+    def _label(self, node: int) -> Tuple[int, int]:
+        # (start, end) of the path label of node, leaves run to the end of the sequence including the terminal
+        if node >= self.internalCnt:
+            start = int(self.suffixArray[self.leafStart + node - self.internalCnt])
+            return start, len(self.codes)
+        start = int(self.suffixArray[self.lb[node]])
+        return start, start + int(self.depth[node])
+
+    def frequent_pattern(self, freqThresh, lenThresh, greedy = False, deadline: float = None):
+        """deadline is a time.perf_counter() value, TimeoutError is raised once the search runs past it."""
+        return self._merge_root_children(self._search_root_children(freqThresh, lenThresh, greedy, deadline), freqThresh)
+
+    def _search_root_children(self, freqThresh, lenThresh, greedy, deadline: float = None) -> list:
+        """
+        Search the subtree of each internal root child of freqThresh suffixes or more on its own. The closed search only
+        couples these subtrees through the counts of root children, which the count reduction of a subtree lowers and
+        the search of a later root child checks, so the reductions of other root children are returned instead of applied.
+        Return (leftmost occurrence, first code, suffix count, patterns as (start, length, suffix indexes), reductions by
+        first code) per root child, in the order of the root children.
+        """
+        m = self.internalCnt
+        leafCnt = self.leafCnt.tolist()
+        childStart = self.childStart.tolist()
+        children = self.children.tolist()
+        codes = self.codes.tolist()
+        sa = self.suffixArray
+        leafStart = self.leafStart
+
+        def reduce_leaf_cnt(node, rootChild, labels):
+            # same count reduction as SuffixTree.frequent_pattern, patterns are closed at the highest frequency. The
+            # counts of the label codes are reduced by label_reductions, labels gets (start, end, count) per node.
+            stack = [(node, iter(children[childStart[node]:childStart[node + 1]]) if node < m else iter(()))]
+            while stack:
+                if deadline is not None and time.perf_counter() > deadline:
+                    raise TimeoutError('Frequent pattern mining ran past its deadline.')
+                n, it = stack[-1]
+                for child in it:
+                    if leafCnt[child] >= freqThresh:
+                        leafCnt[n] -= leafCnt[child]
+                        stack.append((child, iter(children[childStart[child]:childStart[child + 1]]) if child < m else iter(())))
+                        break
+                else:
+                    stack.pop()
+                    # the label of the root child starts with its own first code, which zeroes its count before the
+                    # rest of the label is counted
+                    if n != rootChild:
+                        labels.append((*self._label(n), leafCnt[n]))
+
+        def label_reductions(labels, first) -> Dict[int, int]:
+            # the label counts by code in one pass over the span of the labels, each position weighted by the counts of
+            # the labels that cover it. The first code is the root child itself, whose count is not read again.
+            if len(labels) == 0:
+                return {}
+            starts, ends, counts = np.array(labels, dtype=np.int64).T
+            lo, hi = int(starts.min()), int(ends.max())
+            weights = np.zeros(hi - lo + 1, dtype=np.int64)
+            np.add.at(weights, starts - lo, counts)
+            np.add.at(weights, ends - lo, -counts)
+            totals = np.bincount(self.codes[lo:hi], weights=np.cumsum(weights[:-1]))
+            return {c: int(round(totals[c])) for c in np.flatnonzero(totals).tolist() if c != first}
+
+        def get_suffix_indexes(node) -> List[int]:
+            ans = []
+            stack = [node]
+            while stack:
+                n = stack.pop()
+                if n >= m:
+                    ans.append(int(sa[leafStart + n - m]))
+                else:
+                    stack.extend(reversed(children[childStart[n]:childStart[n + 1]]))
+            return ans
+
+        ret = []
+        for rootChild in children[childStart[self.root]:childStart[self.root + 1]]:
+            if rootChild >= m or leafCnt[rootChild] < freqThresh:
+                continue
+            first = codes[self._label(rootChild)[0]]
+            count = leafCnt[rootChild]
+            patterns = []
+            labels = []
+            stack = [rootChild]
+            while stack:
+                if deadline is not None and time.perf_counter() > deadline:
+                    raise TimeoutError('Frequent pattern mining ran past its deadline.')
+                node = stack.pop()
+                if node >= m or leafCnt[node] < freqThresh:
+                    continue
+                pathLen = int(self.depth[node])
+                if pathLen >= lenThresh:
+                    start = int(sa[self.lb[node]])
+                    indexes = get_suffix_indexes(node)
+                    if not greedy:
+                        reduce_leaf_cnt(node, rootChild, labels)
+                    patterns.append((start, pathLen, indexes))
+                else:
+                    stack.extend(reversed(children[childStart[node]:childStart[node + 1]]))
+            ret.append((int(self.firstOccurrence[rootChild]), first, count, patterns, label_reductions(labels, first)))
+        return ret
+
+    def _merge_root_children(self, results: list, freqThresh) -> Dict[tuple, List[Tuple[int, int]]]:
+        """The patterns of the root children searched by _search_root_children, searched again in order with the reductions applied."""
+        ans: Dict[tuple, List[Tuple[int, int]]] = {}
+        reduced = {} # first code -> reduction of the count of its root child by the root children before it
+        for _, first, count, patterns, reductions in sorted(results, key=lambda r: r[0]):
+            if count - reduced.get(first, 0) < freqThresh:
+                continue
+            for start, length, indexes in patterns:
+                ans[self.S[start:start + length]] = [(i, i + length) for i in indexes]
+            for c, x in reductions.items():
+                reduced[c] = reduced.get(c, 0) + x
+        return ans
+
+def _search_shard(shmName: str, n: int, lo: int, hi: int, freqThresh, lenThresh, greedy, seconds: float = None) -> list:
+    """_search_root_children of positions lo..hi of the suffix array shared by ShardedSuffixArray, run in a worker."""
+    shm = shared_memory.SharedMemory(name=shmName)
+    miner = SuffixArray.__new__(SuffixArray)
+    try:
+        miner.codes, miner.suffixArray, miner.lcp = np.ndarray((3, n), dtype=np.int64, buffer=shm.buf)
+        miner._build_interval_tree(lo, hi)
+        return miner._search_root_children(freqThresh, lenThresh, greedy, None if seconds is None else time.perf_counter() + seconds)
+    finally:
+        # the memory can only be closed once no array is backed by it
+        miner.codes = miner.suffixArray = miner.lcp = None
+        shm.close()
+
+class ShardedSuffixArray(SuffixArray):
+    """
+    SuffixArray that searches frequent patterns in worker processes. The suffix array is split into one contiguous
+    range of root children per worker, each worker builds the interval tree of its range and searches it, and the
+    results are merged in root child order, so the patterns and their order are those of SuffixArray. The codes, suffix
+    array and LCP array go to the workers through shared memory. Sequences shorter than minLength are searched in
+    process, where the workers would cost more than they save.
+    """
+    workers = os.cpu_count() or 1
+    minLength = 100000
+    _pool: ProcessPoolExecutor = None
+
+    def _sharded(self) -> bool:
+        return self.workers > 1 and len(self.codes) >= self.minLength
+
+    def _build_interval_tree(self, lo: int = 0, hi: int = None):
+        if lo != 0 or hi is not None or not self._sharded():
+            super()._build_interval_tree(lo, hi)
+
+    @classmethod
+    def _shard_pool(cls) -> ProcessPoolExecutor:
+        if ShardedSuffixArray._pool is None:
+            ShardedSuffixArray._pool = ProcessPoolExecutor(max_workers=cls.workers)
+        return ShardedSuffixArray._pool
+
+    def _shards(self) -> List[Tuple[int, int]]:
+        """Contiguous ranges of the suffix array of about the same size, a root child starts where the LCP is 0."""
+        n = len(self.codes)
+        starts = np.flatnonzero(self.lcp == 0)
+        cuts = np.unique(starts[np.minimum(np.searchsorted(starts, np.arange(self.workers) * n // self.workers), len(starts) - 1)])
+        return list(zip(cuts.tolist(), (np.append(cuts[1:], n) - 1).tolist()))
+
+    def frequent_pattern(self, freqThresh, lenThresh, greedy = False, deadline: float = None):
+        if not self._sharded():
+            return super().frequent_pattern(freqThresh, lenThresh, greedy, deadline)
+        n = len(self.codes)
+        shm = shared_memory.SharedMemory(create=True, size=3 * n * 8)
+        try:
+            shared = np.ndarray((3, n), dtype=np.int64, buffer=shm.buf)
+            shared[0], shared[1], shared[2] = self.codes, self.suffixArray, self.lcp
+            del shared
+            seconds = None if deadline is None else deadline - time.perf_counter()
+            try:
+                futures = [self._shard_pool().submit(_search_shard, shm.name, n, lo, hi, freqThresh, lenThresh, greedy, seconds) for lo, hi in self._shards()]
+                results = [r for f in futures for r in f.result()]
+            except BrokenProcessPool:
+                ShardedSuffixArray._pool = None
+                raise
+        finally:
+            shm.close()
+            shm.unlink()
+        return self._merge_root_children(results, freqThresh)
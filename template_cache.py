@@ -0,0 +1,67 @@
+from typing import Dict, List, Set, Tuple
+from pickle_cache import PickleCache
+from univeral_tree import StructTree
+
+class SiteTemplate:
+    """What extraction learned from one page of a site: the node vocabularies, the patterns that produced records and the record container signatures."""
+    def __init__(self, settings: tuple, vocabulary: Dict[str, dict], patterns: List[tuple], containerSignatures: Set[Tuple[int, int]]) -> None:
+        self.settings = settings
+        self.vocabulary = vocabulary
+        self.patterns = patterns
+        self.containerSignatures = containerSignatures
+
+def container_signature(sTree: StructTree, i: int) -> Tuple[int, int]:
+    return (sTree.htpIDs[i], sTree.tagAttribIDs[i])
+
+class TemplateCache(PickleCache):
+    """PickleCache of SiteTemplate by site, bounded to maxSites sites, on disk too with a folder."""
+    def __init__(self, path: str = None, maxSites: int = 1000) -> None:
+        super().__init__(path, maxSites)
+        self.mismatches = 0 # a template was found but the page no longer matches it
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses + self.mismatches
+        return 0 if total == 0 else self.hits / total
+
+def _template_records(sTree: StructTree, template: SiteTemplate, lenThresh: int, freqThresh: int, recordHeightThresh, recordSizeThresh, minKnownContainers: float):
+    """Record groups from the known patterns of the template, or None if the page no longer matches the template."""
+    knownPattern = {p: indexes for p, indexes in sTree.find_patterns(template.patterns).items() if len(indexes) >= freqThresh}
+    if len(knownPattern) == 0:
+        return None
+    recordGroups = sTree.pattern_records(knownPattern, lenThresh, freqThresh, recordHeightThresh, recordSizeThresh)
+    containers = [i for g in recordGroups for i in g]
+    if len(containers) == 0:
+        return None
+    knownContainers = sum(1 for i in containers if container_signature(sTree, i) in template.containerSignatures)
+    if knownContainers < minKnownContainers * len(containers):
+        return None
+    return recordGroups
+
+def extract_with_template(elm, cache: TemplateCache, site: str, lenThresh: int, freqThresh: int, recordHeightThresh, recordSizeThresh, greedyPattern=False,
+        pattern_method=StructTree.STRUCT_PATTERN, pattern_miner=StructTree.SUFFIX_ARRAY_MINER, stats=None, minKnownContainers: float = 0.5, text_hash=False, pruned_mining=False, mining_height_thresh=1, budget=None):
+    """
+    StructTree.record_boundary with a site template cache. If the site has a template, the page is encoded with the
+    vocabulary of the site and the records are found from the occurrences of the known patterns, without mining
+    frequent patterns. The page is mined in full if there is no template or the page no longer matches it, that is,
+    no known pattern is frequent, no record is found, or less than minKnownContainers of the record containers have
+    a known signature. Full mining updates the template, unless the budget made it degrade to a cheaper strategy.
+    Return the record groups, the StructTree and whether the template was used.
+    """
+    settings = (pattern_method, lenThresh, freqThresh, recordHeightThresh, recordSizeThresh, greedyPattern, mining_height_thresh)
+    template = cache.get(site)
+    if template is not None and template.settings != settings:
+        template = None
+    sTree = StructTree(elm, pattern_method=pattern_method, pattern_miner=pattern_miner, stats=stats, vocabulary=template.vocabulary if template is not None else None, text_hash=text_hash, pruned_mining=pruned_mining, mining_height_thresh=mining_height_thresh)
+    if template is not None:
+        recordGroups = _template_records(sTree, template, lenThresh, freqThresh, recordHeightThresh, recordSizeThresh, minKnownContainers)
+        if recordGroups is not None:
+            cache.hits += 1
+            return recordGroups, sTree, True
+        cache.mismatches += 1
+    else:
+        cache.misses += 1
+    recordGroups = sTree.record_boundary(lenThresh, freqThresh, recordHeightThresh, recordSizeThresh, greedyPattern=greedyPattern, budget=budget)
+    if len(recordGroups) > 0 and sTree.strategy == StructTree.FULL_STRATEGY:
+        containerSignatures = set(container_signature(sTree, i) for g in recordGroups for i in g)
+        cache.put(site, SiteTemplate(settings, sTree.export_vocabulary(), list(sTree.recordPatterns), containerSignatures))
+    return recordGroups, sTree, False
@@ -0,0 +1,55 @@
+import io
+import unittest
+from unittest import mock
+from lxml import etree, html
+from univeral_tree import build_lxml_tree, CHUNK_SIZE
+
+DOCUMENTS = {
+    'full page': '<!DOCTYPE html><html><head><title>t</title></head><body><div><p>a</p><p>b</p></div></body></html>',
+    'html element': '  <html><body><p>a</p></body></html>',
+    'head and body': '<head><title>t</title></head><body><p>a</p></body>',
+    'one element': '<div><p>a</p><p>b</p></div>',
+    'one element with tail': '<div><p>a</p></div> tail',
+    'block fragment': '<p>a</p><p>b</p>',
+    'inline fragment': '<b>a</b><i>b</i>',
+    'text and element': 'some text <b>a</b>',
+    'text only': 'just some text',
+    'looks like json': '[Ad] <div><p>a</p></div>',
+    'long fragment': '<p>a</p>' * (CHUNK_SIZE // 4),
+}
+
+class BuildLxmlTreeTest(unittest.TestCase):
+    """build_lxml_tree returns the element html.fromstring returns, for str, bytes and streamed file input."""
+    def test_html_fromstring_parity(self):
+        for name, document in DOCUMENTS.items():
+            expected = etree.tostring(html.fromstring(document))
+            inputs = {'str': document, 'bytes': document.encode('utf-8'), 'text file': io.StringIO(document), 'binary file': io.BytesIO(document.encode('utf-8'))}
+            for kind, input in inputs.items():
+                with self.subTest(document=name, input=kind):
+                    self.assertEqual(etree.tostring(build_lxml_tree(input)), expected)
+
+    def test_without_private_block_check(self):
+        # streamed fragments do not depend on the private helper of lxml
+        for name, document in DOCUMENTS.items():
+            expected = etree.tostring(html.fromstring(document))
+            with self.subTest(document=name), mock.patch.dict(html.__dict__):
+                del html.__dict__['_contains_block_level_tag']
+                self.assertEqual(etree.tostring(build_lxml_tree(io.BytesIO(document.encode('utf-8')))), expected)
+
+    def test_empty_document(self):
+        for input in ['', '  \n', io.BytesIO(b'')]:
+            with self.subTest(input=input):
+                with self.assertRaises(etree.ParserError):
+                    build_lxml_tree(input)
+
+    def test_json(self):
+        document = '{"a": [1, "b"], "c": {"d": null}}'
+        for input in [document, document.encode('utf-8'), io.BytesIO(document.encode('utf-8'))]:
+            with self.subTest(input=input):
+                self.assertEqual(etree.tostring(build_lxml_tree(input)), b'<json><dict><a><list><null>1</null><null>b</null></list></a><c><dict><d><null>None</null></d></dict></c></dict></json>')
+        # only a sniffed format falls back to HTML
+        with self.assertRaises(ValueError):
+            build_lxml_tree(DOCUMENTS['looks like json'], format='json')
+
+if __name__ == '__main__':
+    unittest.main()
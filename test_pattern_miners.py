@@ -0,0 +1,58 @@
+import os
+import random
+import unittest
+from suffix_array import SuffixArray, ShardedSuffixArray
+from univeral_tree import build_lxml_tree, StructTree, SuffixTree
+
+SAMPLE_PAGES = ['amazon.html', 'google.html', 'comments.html']
+THRESHOLDS = [(2, 1), (2, 2), (3, 3), (5, 5)] # (freqThresh, lenThresh)
+
+def random_sequences(count, seed=3):
+    """Short sequences of a few symbols, most of them repeats of a base run, so that patterns nest and overlap."""
+    rand = random.Random(seed)
+    ret = []
+    for _ in range(count):
+        symbols = rand.randint(1, 6)
+        base = [rand.randint(1, symbols) for _ in range(rand.randint(1, 8))]
+        length = rand.randint(1, 300)
+        s = []
+        while len(s) < length:
+            s += base if rand.random() < 0.6 else [rand.randint(1, symbols + 3)]
+        ret.append(s[:length])
+    return ret
+
+class PatternMinerTest(unittest.TestCase):
+    """All pattern miners return the same patterns with the same occurrences in the same order."""
+    @classmethod
+    def setUpClass(cls):
+        cls.minLength, cls.workers = ShardedSuffixArray.minLength, ShardedSuffixArray.workers
+        # shard every sequence over several workers, whatever the number of CPUs
+        ShardedSuffixArray.minLength, ShardedSuffixArray.workers = 0, 3
+
+    @classmethod
+    def tearDownClass(cls):
+        ShardedSuffixArray.minLength, ShardedSuffixArray.workers = cls.minLength, cls.workers
+
+    def assert_same_patterns(self, sequence, thresholds):
+        miners = [SuffixTree(sequence), SuffixArray(sequence), ShardedSuffixArray(sequence)]
+        for freqThresh, lenThresh in thresholds:
+            for greedy in [False, True]:
+                with self.subTest(freqThresh=freqThresh, lenThresh=lenThresh, greedy=greedy):
+                    expected, *others = [list(m.frequent_pattern(freqThresh, lenThresh, greedy=greedy).items()) for m in miners]
+                    for miner, patterns in zip(miners[1:], others):
+                        self.assertEqual(patterns, expected, type(miner).__name__)
+
+    def test_random_sequences(self):
+        for sequence in random_sequences(100):
+            self.assert_same_patterns(sequence, THRESHOLDS)
+
+    def test_sample_pages(self):
+        for path in SAMPLE_PAGES:
+            with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), path), encoding='utf-8') as file:
+                sTree = StructTree(build_lxml_tree(file.read()))
+            for encoding in [StructTree.STRUCT_PATTERN, StructTree.TAG_PATTERN]:
+                with self.subTest(page=path, encoding=encoding):
+                    self.assert_same_patterns(list(sTree.encoding_sequence(encoding)), [(3, 3), (5, 5)])
+
+if __name__ == '__main__':
+    unittest.main()
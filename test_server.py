@@ -0,0 +1,111 @@
+import http.client
+import json
+import os
+import threading
+import time
+import unittest
+from server import ExtractionService, get_args, make_server
+
+def read_page(path):
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), path), 'rb') as file:
+        return file.read()
+
+class ServerTest(unittest.TestCase):
+    """The extraction service answered over HTTP on a free local port, with one worker."""
+    @classmethod
+    def start(cls, *argv):
+        service = ExtractionService(get_args(['--port=0', '--workers=1', *argv]))
+        server = make_server(service)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        cls.servers.append((server, service, thread))
+        return server
+
+    @classmethod
+    def setUpClass(cls):
+        cls.servers = []
+        cls.server = cls.start('--len-thresh=5', '--freq-thresh=5')
+        # a deadline that has passed when the worker starts the page
+        cls.slowServer = cls.start('--timeout=0.001')
+
+    @classmethod
+    def tearDownClass(cls):
+        for server, service, thread in cls.servers:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+            service.shutdown()
+
+    def request(self, server, method, path, body=None):
+        connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=60)
+        try:
+            connection.request(method, path, body=body)
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            connection.close()
+
+    def test_extract(self):
+        status, body = self.request(self.server, 'POST', '/extract?record_html=1', read_page('comments.html'))
+        self.assertEqual(status, 200)
+        self.assertEqual(body['strategy'], 'full')
+        self.assertGreater(len(body['records']), 0)
+        self.assertEqual(set(body['records'][0]), {'group', 'index', 'xpath', 'text', 'html'})
+        status, body = self.request(self.server, 'POST', '/extract?format=json&len_thresh=3&freq_thresh=3', json.dumps([{'a': str(i), 'b': {'c': i}} for i in range(10)]).encode('utf-8'))
+        self.assertEqual(status, 200)
+        self.assertIn('pointer', body['records'][0])
+        # HTML that starts like JSON is parsed as HTML when the format is not given
+        status, body = self.request(self.server, 'POST', '/extract?len_thresh=3&freq_thresh=3', b'[Ad] <ul>' + b'<li><a>x</a><b>y z</b></li>' * 5 + b'</ul>')
+        self.assertEqual(status, 200)
+        self.assertEqual(len(body['records']), 5)
+
+    def test_bad_request(self):
+        for query in ['encoding=unknown', 'len_thresh=three', 'format=xml']:
+            with self.subTest(query=query):
+                status, body = self.request(self.server, 'POST', f'/extract?{query}', b'<p>a</p>')
+                self.assertEqual(status, 400)
+                self.assertIn('error', body)
+        self.assertEqual(self.request(self.server, 'GET', '/unknown')[0], 404)
+
+    def test_rejected(self):
+        service = self.server.service
+        for _ in range(service.maxInFlight):
+            service.slots.acquire()
+        try:
+            status, _ = self.request(self.server, 'POST', '/extract', b'<p>a</p>')
+        finally:
+            for _ in range(service.maxInFlight):
+                service.slots.release()
+        self.assertEqual(status, 503)
+
+    def test_timeout(self):
+        status, _ = self.request(self.slowServer, 'POST', '/extract', read_page('amazon.html'))
+        self.assertEqual(status, 504)
+        metrics = self.metrics(self.slowServer)
+        self.assertEqual(metrics['timeout'], 1)
+        self.assertEqual(metrics['in_flight'], 0)
+
+    def metrics(self, server):
+        # a page leaves the in-flight count once its worker is done, which may be right after the answer
+        for _ in range(100):
+            status, body = self.request(server, 'GET', '/metrics')
+            if body['in_flight'] == 0:
+                break
+            time.sleep(0.05)
+        self.assertEqual(status, 200)
+        return body
+
+    def test_metrics(self):
+        before = self.metrics(self.server)
+        self.assertEqual(self.request(self.server, 'POST', '/extract', read_page('google.html'))[0], 200)
+        self.assertEqual(self.request(self.server, 'POST', '/extract?encoding=unknown', b'<p>a</p>')[0], 400)
+        after = self.metrics(self.server)
+        self.assertEqual(after['requests'] - before['requests'], 2)
+        self.assertEqual(after['ok'] - before['ok'], 1)
+        self.assertEqual(after['bad_request'] - before['bad_request'], 1)
+        self.assertEqual(after['in_flight'], 0)
+        self.assertEqual(after['workers'], 1)
+        self.assertGreater(after['latency_p50'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
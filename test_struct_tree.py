@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import unittest
+from run_utils import iter_records
+from univeral_tree import build_lxml_tree, StructTree
+
+SAMPLE_PAGES = ['amazon.html', 'google.html', 'comments.html']
+ENCODINGS = [StructTree.STRUCT_PATTERN, StructTree.NODE_SIGNATURE_PATTERN, StructTree.HTP_PATTERN, StructTree.TAG_PATTERN]
+EXPECTED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_struct_tree.json')
+TAGS = ['div', 'span', 'p', 'a', 'b', 'li', 'td', 'img', 'h3']
+WORDS = ['price', 'new', 'red', 'shoe', 'the', 'deal', 'free', 'ship', '12', '$3']
+
+def read_page(path):
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), path), encoding='utf-8') as file:
+        return file.read()
+
+def random_template(rand, depth):
+    """A random record layout, nested tags with an optional flag on some of them."""
+    if depth == 0 or rand.random() < 0.3:
+        return (rand.choice(TAGS), rand.random() < 0.2, [])
+    return (rand.choice(TAGS), rand.random() < 0.2, [random_template(rand, depth - 1) for _ in range(rand.randint(1, 3))])
+
+def render(rand, template):
+    tag, optional, children = template
+    if optional and rand.random() < 0.4:
+        return ''
+    text = ' '.join(rand.choice(WORDS) for _ in range(rand.randint(0, 3)))
+    return f'<{tag} class="c{len(children)}">{text}{"".join(render(rand, c) for c in children)}</{tag}>'
+
+def random_page(seed):
+    """A page of a few lists of records, each list with its own layout and optional parts, among noise elements."""
+    rand = random.Random(seed)
+    body = []
+    for _ in range(rand.randint(1, 4)):
+        template = random_template(rand, rand.randint(1, 4))
+        container = rand.choice(['ul', 'div', 'table'])
+        body.append(f'<{container}>' + ''.join(render(rand, template) for _ in range(rand.randint(2, 9))) + f'</{container}>')
+        if rand.random() < 0.5:
+            body.append(render(rand, random_template(rand, 3)))
+    rand.shuffle(body)
+    return '<html><body>' + ''.join(body) + '</body></html>'
+
+def page_cases():
+    """(key, page text, encoding, greedy, lenThresh, freqThresh) of the sample pages and of the generated pages."""
+    for path in SAMPLE_PAGES:
+        text = read_page(path)
+        for encoding in ENCODINGS:
+            for greedy in [False, True]:
+                for lenThresh, freqThresh in [(5, 5), (3, 3)]:
+                    yield f'{path}-{encoding}-{greedy}-{lenThresh}-{freqThresh}', text, encoding, greedy, lenThresh, freqThresh
+    for seed in range(200):
+        encoding = ENCODINGS[seed % len(ENCODINGS)]
+        for greedy in [False, True]:
+            yield f'random-{seed}-{encoding}-{greedy}-2-2', random_page(seed), encoding, greedy, 2, 2
+
+def record_summary(text, encoding, greedy, lenThresh, freqThresh):
+    """The number of record groups and records found on the page, and a digest of the sorted groups."""
+    sTree = StructTree(build_lxml_tree(text), pattern_method=encoding)
+    recordGroups = sorted(list(g) for g in sTree.record_boundary(lenThresh, freqThresh, 2, 2, greedyPattern=greedy))
+    return [len(recordGroups), sum(len(g) for g in recordGroups), hashlib.sha1(json.dumps(recordGroups).encode('utf-8')).hexdigest()]
+
+class RecordBoundaryTest(unittest.TestCase):
+    """record_boundary finds the records frozen in test_struct_tree.json, run with --freeze to write them again."""
+    @classmethod
+    def setUpClass(cls):
+        with open(EXPECTED_PATH, encoding='utf-8') as file:
+            cls.expected = json.load(file)
+
+    def test_record_boundary(self):
+        for key, *case in page_cases():
+            with self.subTest(case=key):
+                self.assertEqual(record_summary(*case), self.expected[key])
+
+def random_json(rand, depth=0):
+    """A random JSON value, with keys that are also tag names of the tree or in TAG_BLACK_LIST."""
+    r = rand.random()
+    if depth > 4 or r < 0.3:
+        return rand.choice(['', 'hello world', ' lead', 'trail ', 'x', 12, 3.5, True, False, None, 'multi  word  text', '\u00fcn\u00ef \u2603'])
+    if r < 0.65:
+        return {rand.choice(['a', 'name', 'price', 'script', 'style', 'dict', 'list', 'null', 'json']) + rand.choice(['', '0', '1']): random_json(rand, depth + 1) for _ in range(rand.randint(0, 5))}
+    return [random_json(rand, depth + 1) for _ in range(rand.randint(0, 6))]
+
+def product_json(count):
+    return {'meta': {'page': 1}, 'results': [{'id': i, 'title': f'Item {i}', 'price': {'amount': i * 1.5, 'currency': 'USD'}, 'tags': ['a', 'b'][:i % 3], 'prime': i % 2 == 0} for i in range(count)]}
+
+class FromJsonTest(unittest.TestCase):
+    """from_json builds the tree StructTree builds from the DOM of build_lxml_tree, without the DOM."""
+    def test_documents(self):
+        rand = random.Random(1)
+        documents = ['"top string"', '[1, "a", null]', '{}', '[]', '\ufeff{"a": "b"}', json.dumps(product_json(3)), json.dumps(product_json(30))]
+        documents += [json.dumps(random_json(rand)) for _ in range(100)]
+        for k, document in enumerate(documents):
+            textHash = k % 2 == 0
+            with self.subTest(document=document[:80]):
+                expected = StructTree(build_lxml_tree(document, format='json'), text_hash=textHash)
+                sTree = StructTree.from_json(document, text_hash=textHash)
+                for name in StructTree.SAVED_COLUMNS:
+                    if name != 'textHashes' or textHash:
+                        self.assertEqual(list(getattr(sTree, name)), list(getattr(expected, name)), name)
+                self.assertEqual(sTree.export_vocabulary(), expected.export_vocabulary())
+                self.assertEqual((sTree.structFreqency, sTree.structSize, sTree.structHeight), (expected.structFreqency, expected.structSize, expected.structHeight))
+                self.assertEqual([sTree.text_content(i) for i in range(len(sTree))], [expected.text_content(i) for i in range(len(expected))])
+                self.assertEqual([sTree.node_path(i) for i in range(len(sTree))], [expected.node_path(i) for i in range(len(expected))])
+                self.assertEqual(sTree.record_boundary(3, 3, 2, 2), expected.record_boundary(3, 3, 2, 2))
+
+class SaveLoadTest(unittest.TestCase):
+    """A loaded tree has the columns of the saved one and gives the same records without parsing the page."""
+    def assert_same_after_load(self, sTree, elm_loader):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'tree.bin')
+            sTree.save(path)
+            loaded = StructTree.load(path, elm_loader=elm_loader)
+            for name in StructTree.SAVED_COLUMNS:
+                self.assertEqual(list(getattr(loaded, name)), list(getattr(sTree, name)), name)
+            self.assertEqual(loaded.nodeEncodingSequence, sTree.nodeEncodingSequence)
+            recordGroups = loaded.record_boundary(3, 3, 2, 2)
+            self.assertEqual(recordGroups, sTree.record_boundary(3, 3, 2, 2))
+            self.assertEqual(list(iter_records(loaded, recordGroups)), list(iter_records(sTree, recordGroups)))
+            self.assertIsNone(loaded._elm)
+            self.assertEqual(list(iter_records(loaded, recordGroups, outerHTML=True)), list(iter_records(sTree, recordGroups, outerHTML=True)))
+
+    def test_sample_pages(self):
+        for path in SAMPLE_PAGES:
+            text = read_page(path)
+            with self.subTest(page=path):
+                self.assert_same_after_load(StructTree(build_lxml_tree(text), text_hash=True), lambda: build_lxml_tree(text))
+
+    def test_random_pages(self):
+        for seed in range(20):
+            text = random_page(seed)
+            with self.subTest(seed=seed):
+                self.assert_same_after_load(StructTree(build_lxml_tree(text), text_hash=seed % 2 == 0), lambda: build_lxml_tree(text))
+
+    def test_json(self):
+        text = json.dumps(product_json(30))
+        self.assert_same_after_load(StructTree.from_json(text, elm_loader=lambda: build_lxml_tree(text, format='json')), lambda: build_lxml_tree(text, format='json'))
+
+class RootNodeTest(unittest.TestCase):
+    """The tree has the node properties of its root, as when StructTree was the root StructNode."""
+    def test_root_properties(self):
+        for path in SAMPLE_PAGES:
+            sTree = StructTree(build_lxml_tree(read_page(path)))
+            root = sTree[len(sTree) - 1]
+            with self.subTest(page=path):
+                self.assertIs(sTree.root, sTree)
+                self.assertIsNone(sTree.parent)
+                self.assertEqual((sTree.size, sTree.height, sTree.depth, sTree.startIndex, sTree.endIndex), (len(sTree), max(sTree.heights), 0, 0, len(sTree)))
+                self.assertEqual(sTree.children, root.children)
+                self.assertEqual([c.parent for c in sTree.children], [root] * len(root.children))
+                for name in ['tag', 'attrib', 'tagAttrib', 'structure', 'tagID', 'tagAttribID', 'htpID', 'structID']:
+                    self.assertEqual(getattr(sTree, name), getattr(root, name), name)
+
+class ExtendTest(unittest.TestCase):
+    """extend gives the columns, encodings and elements a rebuild with the same vocabulary gives."""
+    def assert_extend_matches_rebuild(self, text, pick, cut, textHash):
+        elm = build_lxml_tree(text)
+        parentElm = pick([e for e in StructTree(elm).elements if len(e) > 0])
+        removed = list(parentElm)[max(len(parentElm) - cut, 0):]
+        for e in removed:
+            parentElm.remove(e)
+        sTree = StructTree(elm, text_hash=textHash)
+        recordGroups = sTree.record_boundary(3, 3, 2, 2)
+        sTree.extend(sTree.elementIndexes[parentElm], removed, recordGroups, 3, 3, 2, 2)
+        rebuilt = StructTree(elm, vocabulary=sTree.export_vocabulary(), text_hash=textHash)
+        for name in StructTree.SAVED_COLUMNS:
+            if name != 'textHashes' or textHash:
+                self.assertEqual(list(getattr(sTree, name)), list(getattr(rebuilt, name)), name)
+        self.assertEqual(sTree.nodeEncodingSequence, rebuilt.nodeEncodingSequence)
+        self.assertEqual(sTree.structFreqency, rebuilt.structFreqency)
+        self.assertEqual(sTree.elements, rebuilt.elements)
+
+    def test_sample_pages(self):
+        rand = random.Random(1)
+        for path in SAMPLE_PAGES:
+            text = read_page(path)
+            for cut in [1, 10]:
+                with self.subTest(page=path, parent='most children', cut=cut):
+                    self.assert_extend_matches_rebuild(text, lambda elements: max(elements, key=len), cut, True)
+            for k in range(3):
+                seed = rand.random()
+                with self.subTest(page=path, parent=seed):
+                    self.assert_extend_matches_rebuild(text, lambda elements: random.Random(seed).choice(elements), 3, k % 2 == 0)
+
+    def test_random_pages(self):
+        for seed in range(50):
+            with self.subTest(seed=seed):
+                rand = random.Random(seed)
+                self.assert_extend_matches_rebuild(random_page(seed), rand.choice, rand.randint(1, 4), seed % 2 == 0)
+
+if __name__ == '__main__':
+    if '--freeze' in sys.argv:
+        with open(EXPECTED_PATH, 'w', encoding='utf-8') as file:
+            json.dump({key: record_summary(*case) for key, *case in page_cases()}, file, indent=0)
+    else:
+        unittest.main()
@@ -0,0 +1,30 @@
+import os
+import unittest
+from template_cache import TemplateCache, extract_with_template
+from univeral_tree import build_lxml_tree
+
+SAMPLE_PAGES = ['amazon.html', 'google.html', 'comments.html']
+
+def read_page(path):
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), path), encoding='utf-8') as file:
+        return file.read()
+
+class TemplateCacheTest(unittest.TestCase):
+    """Extraction from a cached template finds the records full mining finds, whatever the mining height threshold."""
+    def test_mining_height_thresh(self):
+        for path in SAMPLE_PAGES:
+            text = read_page(path)
+            for heightThresh in [1, 2, 3]:
+                with self.subTest(page=path, heightThresh=heightThresh):
+                    cache = TemplateCache()
+                    mined, _, used = extract_with_template(build_lxml_tree(text), cache, path, 3, 3, 2, 2, mining_height_thresh=heightThresh)
+                    self.assertFalse(used)
+                    if len(mined) == 0:
+                        continue
+                    found, _, used = extract_with_template(build_lxml_tree(text), cache, path, 3, 3, 2, 2, mining_height_thresh=heightThresh)
+                    self.assertTrue(used)
+                    self.assertEqual(found, mined)
+                    self.assertEqual((cache.hits, cache.mismatches), (1, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import hashlib
+import os
+import pickle
+from contextlib import nullcontext
+from univeral_tree import build_lxml_tree, StructTree, CHUNK_SIZE
+
+class TreeCache:
+    """
+    Folder of saved StructTrees, one file per page keyed by the content hash of the page, so pages that are analysed
+    again are neither parsed nor encoded again. The files are memory mapped when loaded.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, inputPath: str, format: str = None, encoding: str = None) -> str:
+        digest = hashlib.sha1(f'{format}:{encoding}:'.encode('utf-8'))
+        with open(inputPath, 'rb') as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key + '.tree')
+
+    def get(self, key: str, elm_loader=None, **kwargs) -> StructTree:
+        if not os.path.isfile(self._file(key)):
+            return None
+        try:
+            return StructTree.load(self._file(key), elm_loader=elm_loader, **kwargs)
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def put(self, key: str, sTree: StructTree):
+        sTree.save(self._file(key))
+
+def cached_tree(inputPath: str, cache: TreeCache, format: str = None, encoding: str = None, stats=None, **kwargs) -> StructTree:
+    """
+    The StructTree of the page at inputPath from the cache, or built from the page and saved to the cache. The DOM of a
+    cached tree is parsed only on first access to its elements. Trees are built with text_hash, so they serve evaluation
+    too. kwargs are passed to StructTree, trees encoded with the vocabulary of another tree are not cached.
+    """
+    def parse():
+        with open(inputPath, 'rb') as file:
+            with (stats.stage('build_lxml_tree') if stats is not None else nullcontext()):
+                return build_lxml_tree(file, format=format, encoding=encoding)
+
+    key = cache.key(inputPath, format, encoding)
+    sTree = cache.get(key, elm_loader=parse, stats=stats, **kwargs)
+    if sTree is not None:
+        cache.hits += 1
+        return sTree
+    cache.misses += 1
+    sTree = StructTree(parse(), stats=stats, text_hash=True, **kwargs)
+    cache.put(key, sTree)
+    return sTree
@@ -1,174 +1,1343 @@
+import hashlib
 import json
-from typing import Dict, List, Tuple, Set
-from lxml import html
-from json.decoder import JSONDecodeError
-from types import SimpleNamespace
+import mmap
+import os
+import pickle
+import re
+from typing import Dict, List, Tuple, Set, NamedTuple, Iterable, Iterator
+from lxml import html, etree
 from collections import Counter
+from collections.abc import Sequence
+from array import array
+from contextlib import contextmanager, nullcontext
 import functools
+import time
+import numpy as np
 from suffix_tree import Tree
 from suffix_tree.node import Node, Internal
 from bisect import bisect
+from suffix_array import SuffixArray, ShardedSuffixArray
 
 TAG_BLACK_LIST = ['script', 'noscript', 'head', 'meta', 'style']
 ATTRIB_BLACK_LIST = ['data-record-boundary', 'userselected', 'optionaluserselected']
-def build_lxml_tree(input):
-    if hasattr(input, 'read'):
-        input = input.read()
-    try:
-        # if the input is json type, we will convert the json into an etree
-        def json_build(parent, jsonNode):
-            if type(jsonNode) == dict:
-                child = html.Element('dict')
-                for key, val in jsonNode.items():
-                    grandChild = html.Element(key)
-                    child.append(grandChild)
-                    if type(val) == str:
-                        grandChild.text = val
-                    else:
-                        json_build(grandChild, val)
-            elif type(jsonNode) == list:
-                child = html.Element('list')
-                for n in jsonNode:
-                    json_build(child, n)
-            else:
-                child = html.Element('null')
-                child.text = str(jsonNode)
-            parent.append(child)
-
-        input = json.loads(input)
-        root = html.Element('json')
-        json_build(root, input)
-    except JSONDecodeError as e:
-        # otherwise, we simply build an etree from the HTML/XML source
-        root = html.fromstring(input)
+INPUT_FORMATS = ['html', 'json']
+CHUNK_SIZE = 1 << 16
+_FULL_HTML_PATTERN = re.compile(r'^\s*<(?:html|!doctype)', re.I)
+_FULL_HTML_BYTES_PATTERN = re.compile(rb'^\s*<(?:html|!doctype)', re.I)
+
+def sniff_format(head) -> str:
+    """Guess the input format from the first characters or bytes of the document."""
+    if isinstance(head, bytes):
+        head = head[:64].decode('utf-8', errors='ignore')
+    head = head.lstrip('\ufeff \t\r\n')
+    return 'json' if head[:1] in ('{', '[') else 'html'
+
+def path_format(path: str) -> str:
+    """The input format of a file by its extension, None if the extension is neither of INPUT_FORMATS."""
+    extension = os.path.splitext(path)[1].lower()
+    return 'json' if extension == '.json' else 'html' if extension in ('.html', '.htm') else None
+
+def _read_chunks(input):
+    """Yield the input in chunks, a str or bytes is yielded whole."""
+    if not hasattr(input, 'read'):
+        yield input
+        return
+    while True:
+        chunk = input.read(CHUNK_SIZE)
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+def _parse_json(source):
+    if isinstance(source, str):
+        source = source.lstrip('\ufeff')
+    return json.loads(source)
+
+def _json_tree(source):
+    # we convert the json into an etree, with an explicit stack of (parent element, json node) pairs
+    root = html.Element('json')
+    stack = [(root, _parse_json(source))]
+    while stack:
+        parent, jsonNode = stack.pop()
+        if type(jsonNode) == dict:
+            child = html.Element('dict')
+            for key, val in jsonNode.items():
+                grandChild = html.Element(key)
+                child.append(grandChild)
+                if type(val) == str:
+                    grandChild.text = val
+                else:
+                    stack.append((grandChild, val))
+        elif type(jsonNode) == list:
+            child = html.Element('list')
+            stack.extend((child, n) for n in reversed(jsonNode))
+        else:
+            child = html.Element('null')
+            child.text = str(jsonNode)
+        parent.append(child)
     return root
 
+def _json_events(value) -> Iterator[tuple]:
+    """The parse events of a parsed JSON value, (event, value) pairs like those of ijson.basic_parse."""
+    stack = [iter([(None, value)])]
+    ends = [None]
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:
+            stack.pop()
+            end = ends.pop()
+            if end is not None:
+                yield (end, None)
+            continue
+        key, jsonNode = item
+        if key is not None:
+            yield ('map_key', key)
+        if type(jsonNode) == dict:
+            yield ('start_map', None)
+            stack.append(iter(jsonNode.items()))
+            ends.append('end_map')
+        elif type(jsonNode) == list:
+            yield ('start_array', None)
+            stack.append((None, n) for n in jsonNode)
+            ends.append('end_array')
+        elif type(jsonNode) == str:
+            yield ('string', jsonNode)
+        else:
+            yield ('null' if jsonNode is None else 'boolean' if type(jsonNode) == bool else 'number', jsonNode)
+
+def _contains_block_level_tag(elm) -> bool:
+    # lxml keeps this check private, it is redone with the public block tags if it ever goes away
+    if hasattr(html, '_contains_block_level_tag'):
+        return html._contains_block_level_tag(elm)
+    return any(etree.QName(e).localname in html.defs.block_tags for e in elm.iter(etree.Element))
+
+def _fragment_root(doc):
+    """
+    The element html.fromstring returns for a document that is not a full HTML page, for the documents streamed from
+    a file, which html.fromstring cannot take. str and bytes input goes through html.fromstring itself.
+    """
+    bodies = doc.findall('body')
+    if len(bodies) == 0:
+        bodies = doc.findall('{%s}body' % html.XHTML_NAMESPACE)
+    body = bodies[0] if len(bodies) > 0 else None
+    for otherBody in bodies[1:]:
+        if otherBody.text:
+            if len(body):
+                body[-1].tail = (body[-1].tail or '') + otherBody.text
+            else:
+                body.text = (body.text or '') + otherBody.text
+        body.extend(otherBody)
+        otherBody.drop_tree()
+    heads = doc.findall('head')
+    if len(heads) == 0:
+        heads = doc.findall('{%s}head' % html.XHTML_NAMESPACE)
+    if len(heads) > 0:
+        for otherHead in heads[1:]:
+            heads[0].extend(otherHead)
+            otherHead.drop_tree()
+        return doc
+    if body is None:
+        return doc
+    if len(body) == 1 and (not body.text or not body.text.strip()) and (not body[-1].tail or not body[-1].tail.strip()):
+        return body[0]
+    body.tag = 'div' if _contains_block_level_tag(body) else 'span'
+    return body
+
+def build_lxml_tree(input, format: str = None, encoding: str = None):
+    """
+    Build an etree from a str, bytes or file object (text or binary) of HTML/XML or JSON.
+    The format is one of INPUT_FORMATS, sniffed from the first characters if not given, a sniffed document that is
+    not valid JSON is parsed as HTML. HTML is fed to the parser in chunks, so a file is never held in memory as a
+    whole. encoding decodes bytes input, by default lxml detects it from the document.
+    Return the same element as html.fromstring, the root of the page, or the fragment for partial HTML.
+    """
+    chunks = _read_chunks(input)
+    head = next(chunks, '')
+    sniffed = format is None
+    if sniffed:
+        format = sniff_format(head)
+    if format == 'json':
+        rest = b''.join(chunks) if isinstance(head, bytes) else ''.join(chunks)
+        head = head + rest if len(rest) > 0 else head
+        try:
+            return _json_tree(head)
+        except ValueError:
+            # HTML that starts with [ or { looks like JSON
+            if not sniffed:
+                raise
+    # huge_tree lifts libxml2's limits on nesting depth and text size
+    parser = html.HTMLParser(encoding=encoding, huge_tree=True)
+    if not hasattr(input, 'read'):
+        return html.fromstring(head, parser=parser)
+    isFullHTML = (_FULL_HTML_BYTES_PATTERN if isinstance(head, bytes) else _FULL_HTML_PATTERN).match(head) is not None
+    parser.feed(head)
+    for chunk in chunks:
+        parser.feed(chunk)
+    doc = parser.close()
+    if doc is None:
+        raise etree.ParserError('Document is empty')
+    return doc if isFullHTML else _fragment_root(doc)
+
+_EMPTY_TEXT = (0, 0, False, False)
+_NO_PIECE = (False, 0, 0, 0, 0)
+_HASH_MOD = (1 << 61) - 1
+
+def _text_summary(text) -> tuple:
+    """(length, word count, starts inside a word, ends inside a word) of a text, enough to add texts up without joining them."""
+    if not text:
+        return _EMPTY_TEXT
+    return (len(text), len(text.split()), not text[0].isspace(), not text[-1].isspace())
+
+def _concat_text(a: tuple, b: tuple) -> tuple:
+    if a[0] == 0:
+        return b
+    if b[0] == 0:
+        return a
+    # a word split between the two texts is counted once
+    return (a[0] + b[0], a[1] + b[1] - (1 if a[3] and b[2] else 0), a[2], b[3])
+
+def _piece_summary(text) -> tuple:
+    """
+    Summary of a sequence of stripped texts joined by spaces and stripped, kept as (has a non-empty piece, empty pieces
+    before the first non-empty one, hash and UTF-8 length of the text from the first to the last non-empty piece,
+    empty pieces after the last non-empty one). The hash is the text bytes as a base-256 number modulo a prime.
+    """
+    if text is None:
+        return _NO_PIECE
+    text = text.strip().encode('utf-8')
+    if len(text) == 0:
+        return (False, 1, 0, 0, 0)
+    return (True, 0, int.from_bytes(text, 'big') % _HASH_MOD, len(text), 0)
+
+def _join_pieces(a: tuple, b: tuple) -> tuple:
+    if not b[0]:
+        return (True, a[1], a[2], a[3], a[4] + b[1]) if a[0] else (False, a[1] + b[1], 0, 0, 0)
+    if not a[0]:
+        return (True, a[1] + b[1], b[2], b[3], b[4])
+    # every empty piece in between adds one more space
+    spaces = a[4] + b[1] + 1
+    spaceHash = int.from_bytes(b' ' * spaces, 'big') % _HASH_MOD
+    h = (a[2] * pow(256, spaces + b[3], _HASH_MOD) + spaceHash * pow(256, b[3], _HASH_MOD) + b[2]) % _HASH_MOD
+    return (True, a[1], h, a[3] + spaces + b[3], b[4])
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+def _tree_elements(elm) -> list:
+    """The elements of the subtree of elm that StructTree keeps, in post-order."""
+    ret = []
+    stack = [(elm, iter(elm))]
+    while stack:
+        for childElement in stack[-1][1]:
+            if hasattr(childElement, 'tag') and type(childElement.tag) == str and childElement.tag not in TAG_BLACK_LIST:
+                stack.append((childElement, iter(childElement)))
+                break
+        else:
+            ret.append(stack.pop()[0])
+    return ret
+
+def _text_pieces(elm, reverse = False):
+    """The pieces of the text content of elm, the same text as xpath('string()'), in document order or in reverse."""
+    # comments and processing instructions only add their tail
+    if not reverse:
+        yield elm.text
+    stack = [(elm, reversed(elm) if reverse else iter(elm))]
+    while stack:
+        e, it = stack[-1]
+        child = next(it, None)
+        if child is None:
+            stack.pop()
+            if reverse:
+                yield e.text
+            elif stack:
+                yield e.tail
+            continue
+        if reverse:
+            yield child.tail
+        if type(child.tag) == str:
+            if not reverse:
+                yield child.text
+            stack.append((child, reversed(child) if reverse else iter(child)))
+        elif not reverse:
+            yield child.tail
+
+def _document_text(elm, elementIndexes: Dict[object, int]) -> Tuple[bytes, array, array]:
+    """
+    The text content of elm in UTF-8, the same as xpath('string()'), and the start and end byte offsets in it of the
+    text content of every element of elementIndexes, by the element index.
+    """
+    pieces = []
+    offset = 0
+    starts = array('i', [0]) * len(elementIndexes)
+    ends = array('i', [0]) * len(elementIndexes)
+
+    def enter(e):
+        nonlocal offset
+        if e in elementIndexes:
+            starts[elementIndexes[e]] = offset
+        # comments and processing instructions only add their tail
+        if type(e.tag) == str and e.text:
+            pieces.append(e.text.encode('utf-8'))
+            offset += len(pieces[-1])
+        return (e, iter(e))
+
+    stack = [enter(elm)]
+    while stack:
+        for child in stack[-1][1]:
+            stack.append(enter(child))
+            break
+        else:
+            e = stack.pop()[0]
+            if e in elementIndexes:
+                ends[elementIndexes[e]] = offset
+            if stack and e.tail:
+                pieces.append(e.tail.encode('utf-8'))
+                offset += len(pieces[-1])
+    return b''.join(pieces), starts, ends
+
 class SuffixTree(Tree):
     def __init__(self, s=None):
         super().__init__({1:s})
         self._count_leaf()
         
     def _count_leaf(self):
-        def count(node: Node):
-            if node.is_internal():
-                node.leafCnt = 0
-                for child in node.children.values():
-                    node.leafCnt += child.leafCnt
-            else:
+        # post-order with an explicit stack, the tree is as deep as the longest repeat in the sequence
+        stack = [(self.root, False)]
+        while stack:
+            node, visited = stack.pop()
+            if not node.is_internal():
                 node.leafCnt = 1
-        
-        self.root.post_order(count)
+            elif visited:
+                node.leafCnt = sum(child.leafCnt for child in node.children.values())
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children.values())
     
-    def frequent_pattern(self, freqThresh, lenThresh, greedy = False):
+    def frequent_pattern(self, freqThresh, lenThresh, greedy = False, deadline: float = None):
+        """deadline is a time.perf_counter() value, TimeoutError is raised once the search runs past it."""
+        # the closed search reduces the leaf counts in place, restore them so the tree can be mined again
+        if getattr(self, 'countReduced', False):
+            self._count_leaf()
+        self.countReduced = not greedy
         def reduce_leaf_cnt(node: Internal, root: Internal):
-            for child in node.children.values():
-                if child.leafCnt >= freqThresh:
-                    node.leafCnt -= child.leafCnt
-                    reduce_leaf_cnt(child, root)
-            for c in node.path.S[node.path.start:node.path.end]:
-                # reduce the frequency count of the sub-suffix because we only return the patterns closed at the highest frequency that satisfy both the length and frequency thresholds.
-                root.children[c].leafCnt -= node.leafCnt
+            # a child is only visited once its earlier siblings are done, their reductions can change its count
+            stack = [(node, iter(node.children.values()))]
+            while stack:
+                if deadline is not None and time.perf_counter() > deadline:
+                    raise TimeoutError('Frequent pattern mining ran past its deadline.')
+                n, it = stack[-1]
+                for child in it:
+                    if child.leafCnt >= freqThresh:
+                        n.leafCnt -= child.leafCnt
+                        stack.append((child, iter(child.children.values())))
+                        break
+                else:
+                    stack.pop()
+                    for c in n.path.S[n.path.start:n.path.end]:
+                        # reduce the frequency count of the sub-suffix because we only return the patterns closed at the highest frequency that satisfy both the length and frequency thresholds.
+                        root.children[c].leafCnt -= n.leafCnt
         
         def get_suffix_indexes(node: Node, ans:List[int]):
-            if node.is_leaf():
-                ans.append(node.path.start)
-            else:
-                for child in node.children.values():
-                    get_suffix_indexes(child, ans)
-
-        def search(node: Internal, root: Internal, freqThresh, lenThresh, ans:Dict[str, List[Tuple[int, int]]]):
-            if node.is_leaf() or node.leafCnt < freqThresh: return
-            pathLen = node.path.end - node.path.start
-            if pathLen >= lenThresh:
-                pattern = node.path.S[node.path.start:node.path.end]
-                indexes = []
-                get_suffix_indexes(node, indexes)
-                if not greedy:
-                    reduce_leaf_cnt(node, root)
-                ans[pattern] = [(i, i + len(pattern)) for i in indexes]
-            else:
-                for key, child in node.children.items():
-                    search(child, root, freqThresh, lenThresh, ans)
+            stack = [node]
+            while stack:
+                n = stack.pop()
+                if n.is_leaf():
+                    ans.append(n.path.start)
+                else:
+                    stack.extend(reversed(list(n.children.values())))
+
+        def search(root: Internal, freqThresh, lenThresh, ans:Dict[str, List[Tuple[int, int]]]):
+            stack = [root]
+            while stack:
+                if deadline is not None and time.perf_counter() > deadline:
+                    raise TimeoutError('Frequent pattern mining ran past its deadline.')
+                node = stack.pop()
+                if node.is_leaf() or node.leafCnt < freqThresh:
+                    continue
+                pathLen = node.path.end - node.path.start
+                if pathLen >= lenThresh:
+                    pattern = node.path.S[node.path.start:node.path.end]
+                    indexes = []
+                    get_suffix_indexes(node, indexes)
+                    if not greedy:
+                        reduce_leaf_cnt(node, root)
+                    ans[pattern] = [(i, i + len(pattern)) for i in indexes]
+                else:
+                    stack.extend(reversed(list(node.children.values())))
         ans = {}
-        search(self.root, self.root, freqThresh, lenThresh, ans)
+        search(self.root, freqThresh, lenThresh, ans)
         return ans
 
+class ExtractionConfig(NamedTuple):
+    """One setting of the record_boundary parameters, for StructTree.sweep."""
+    patternMethod: str
+    lenThresh: int
+    freqThresh: int
+    recordHeightThresh: int
+    recordSizeThresh: int
+    greedyPattern: bool = False
+
+class ExtractionBudget(NamedTuple):
+    """
+    Limits of one record_boundary call, None for no limit. maxNodes bounds the length of the mined sequence,
+    maxPatterns the number of frequent patterns, maxOccurrences the occurrences of the selected patterns and
+    seconds the wall-clock time of the call. fallbackShare is the share of seconds kept for the cheaper strategies
+    when the full one runs out of time, 0 gives all of it to the full strategy and no records past it.
+    """
+    maxNodes: int = None
+    maxPatterns: int = None
+    maxOccurrences: int = None
+    seconds: float = None
+    fallbackShare: float = 0.25
+
+class BudgetExceeded(Exception):
+    """Raised inside record_boundary when a limit of its ExtractionBudget is hit, limit is the name of the field."""
+    def __init__(self, limit: str, message: str) -> None:
+        super().__init__(message)
+        self.limit = limit
+
+class ExtractionStats:
+    """
+    Optional instrumentation of StructTree and record_boundary. Pass an instance as the stats argument of StructTree
+    to collect the wall time of each stage and the size of the intermediate results, StructTree skips all of it otherwise.
+    """
+    def __init__(self) -> None:
+        self.stageSeconds: Dict[str, float] = {}
+        self.nodes = 0
+        self.frequentPatterns = 0
+        self.selectedPatterns = 0
+        self.occurrencesBeforeReduction: List[int] = [] # per selected pattern
+        self.occurrencesAfterReduction: List[int] = [] # per selected pattern
+        self.anchorsPerPattern: List[int] = [] # per reduced pattern
+        self.trieNodesPerPattern: List[int] = [] # per aligned pattern, trie nodes walked by _align_records
+        self.recordGroups = 0
+        self.records = 0
+        self.minedSequenceLength = 0 # length of the last sequence a pattern miner was built over
+        self.strategy: str = None # the strategy of the last record_boundary with a budget
+        self.budgetExceeded: List[str] = [] # the limit hit by each strategy given up in that call
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stageSeconds[name] = self.stageSeconds.get(name, 0.0) + time.perf_counter() - start
+
+    def to_dict(self) -> dict:
+        return {
+            'stage_seconds': self.stageSeconds,
+            'nodes': self.nodes,
+            'frequent_patterns': self.frequentPatterns,
+            'selected_patterns': self.selectedPatterns,
+            'occurrences_before_reduction': self.occurrencesBeforeReduction,
+            'occurrences_after_reduction': self.occurrencesAfterReduction,
+            'anchors_per_pattern': self.anchorsPerPattern,
+            'trie_nodes_per_pattern': self.trieNodesPerPattern,
+            'record_groups': self.recordGroups,
+            'records': self.records,
+            'mined_sequence_length': self.minedSequenceLength,
+            'strategy': self.strategy,
+            'budget_exceeded': self.budgetExceeded,
+        }
+
 class StructNode:
-    def __init__(self, elm, depth, parent: 'StructNode', root: 'StructTree') -> None:
-        self.elm = elm
-        self.parent = parent
+    """
+    A lightweight view of the node at post-order position index of a StructTree.
+    The node data lives in the arrays of the tree, a view only holds the tree and the index.
+    """
+    __slots__ = ('root', 'index')
+
+    def __init__(self, root: 'StructTree', index: int) -> None:
         self.root = root
-        self.tag = elm.tag
-        self.tagAttrib = (elm.tag, tuple(sorted([k for k in elm.keys() if k not in ATTRIB_BLACK_LIST])))
-        self.tagAttribID: int = None
-        self.tagID: int = None
-        self.htpID: int = None
-        self.structure = None
-        self.structID: int = None
-        self.size = 1
-        self.height = 1
-        self.depth = depth
-        self.children = []
-        self.startIndex = len(root.nodeSequence)
-        for childElement in elm:
-            if not (hasattr(childElement, 'tag') and type(childElement.tag) == str) or childElement.tag in TAG_BLACK_LIST:
-                continue
-            childStructNode = StructNode(childElement, depth + 1, self, root)
-            self.children.append(childStructNode)
-            self.size += childStructNode.size
-            self.height = max(self.height, childStructNode.height + 1)
-        self.index = len(root.nodeSequence)
-        root.nodeSequence.append(self)
-        self.endIndex = self.index + 1
-        self.attrib = elm.attrib
-        elm.attrib['data-height'] = str(self.height)
-        elm.attrib['data-size'] = str(self.size)
-        elm.attrib['data-index'] = str(self.index)
-        elm.attrib['data-depth'] = str(self.depth)
-    
-    @functools.cached_property
-    def ancestor_indexes(self):
-        if self.parent is None:
-            return (self.index,)
-        return self.parent.ancestor_indexes + (self.index,)
+        self.index = index
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, StructNode) and self.root is other.root and self.index == other.index
+
+    def __hash__(self) -> int:
+        return hash((id(self.root), self.index))
+
+    @property
+    def elm(self):
+        return self.root.elements[self.index]
+
+    @property
+    def attrib(self):
+        return self.elm.attrib
+
+    @property
+    def tag(self):
+        return self.elm.tag
+
+    @property
+    def parent(self) -> 'StructNode':
+        parentIndex = self.root.parents[self.index]
+        return None if parentIndex < 0 else self.root[parentIndex]
+
+    @property
+    def children(self) -> List['StructNode']:
+        return [self.root[i] for i in self.root.children_indexes(self.index)]
+
+    @property
+    def startIndex(self) -> int:
+        return self.root.startIndexes[self.index]
+
+    @property
+    def endIndex(self) -> int:
+        return self.index + 1
+
+    @property
+    def size(self) -> int:
+        return self.root.sizes[self.index]
+
+    @property
+    def height(self) -> int:
+        return self.root.heights[self.index]
+
+    @property
+    def depth(self) -> int:
+        return self.root.depths[self.index]
+
+    @property
+    def tagID(self) -> int:
+        return self.root.tagIDs[self.index]
+
+    @property
+    def tagAttribID(self) -> int:
+        return self.root.tagAttribIDs[self.index]
+
+    @property
+    def htpID(self) -> int:
+        return self.root.htpIDs[self.index]
 
-class StructTree(StructNode):
+    @property
+    def structID(self) -> int:
+        return self.root.structIDs[self.index]
+
+    @property
+    def tagAttrib(self) -> tuple:
+        return self.root.id2TagAttrib[self.tagAttribID]
+
+    @property
+    def structure(self) -> tuple:
+        return self.root.id2Struct[self.structID]
+
+    @property
+    def ancestor_indexes(self) -> Tuple[int]:
+        return self.root.ancestor_indexes(self.index)
+
+class NodeSequence(Sequence):
+    """The post-order node sequence of a StructTree, with a StructNode view created on access."""
+    def __init__(self, root: 'StructTree') -> None:
+        self.root = root
+
+    def __len__(self) -> int:
+        return len(self.root)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [StructNode(self.root, j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return StructNode(self.root, i)
+
+def _root_property(name: str) -> property:
+    """A property of StructTree that reads the property name of its root node."""
+    return property(lambda self: getattr(self[self.index], name))
+
+class StructTree:
+    """
+    The DOM tree in columnar form. Nodes are numbered by their post-order position, and node data is kept
+    in contiguous int arrays indexed by that position, so the subtree of node i spans [startIndexes[i], i].
+    """
     TAG_PATTERN = 'tag'
     NODE_SIGNATURE_PATTERN = 'signature'
     HTP_PATTERN = 'htp'
     STRUCT_PATTERN = 'structure'
-    def __init__(self, elm, pattern_method = STRUCT_PATTERN) -> None:
-        self.tagAttrib2ID: Dict[tuple, int] = {} # node signature -> node signature ID
-        self.tag2ID: Dict[tuple, int] = {} # tag -> tag ID
-        self.struct2ID: Dict[tuple, int] = {} # structure signature -> structure ID
-        self.htp2ID: Dict[tuple, int] = {}
+    SUFFIX_TREE_MINER = 'suffix-tree'
+    SUFFIX_ARRAY_MINER = 'suffix-array'
+    SHARDED_SUFFIX_ARRAY_MINER = 'sharded-suffix-array'
+    PATTERN_MINERS = {SUFFIX_TREE_MINER: SuffixTree, SUFFIX_ARRAY_MINER: SuffixArray, SHARDED_SUFFIX_ARRAY_MINER: ShardedSuffixArray}
+    SAVED_COLUMNS = ['parents', 'depths', 'sizes', 'heights', 'startIndexes', 'tagIDs', 'tagAttribIDs', 'htpIDs', 'structIDs', 'textLengths', 'wordCounts', 'textHashes']
+    FILE_MAGIC = b'STRTREE1'
+    FULL_STRATEGY = 'full'
+    GREEDY_STRATEGY = 'greedy'
+    PRUNED_STRATEGY = 'pruned'
+    FILTERED_STRATEGY = 'filtered'
+    CAPPED_STRATEGY = 'capped'
+    SKIPPED_STRATEGY = 'skipped'
+    # the tree stands for its root node, like the StructNode it used to be
+    root = property(lambda self: self)
+    parent = _root_property('parent')
+    children = _root_property('children')
+    attrib = _root_property('attrib')
+    tag = _root_property('tag')
+    tagAttrib = _root_property('tagAttrib')
+    structure = _root_property('structure')
+    startIndex = _root_property('startIndex')
+    endIndex = _root_property('endIndex')
+    size = _root_property('size')
+    height = _root_property('height')
+    depth = _root_property('depth')
+    tagID = _root_property('tagID')
+    tagAttribID = _root_property('tagAttribID')
+    htpID = _root_property('htpID')
+    structID = _root_property('structID')
+    def __init__(self, elm, pattern_method = STRUCT_PATTERN, pattern_miner = SUFFIX_ARRAY_MINER, stats: ExtractionStats = None, vocabulary: Dict[str, dict] = None, text_hash = False, pruned_mining = False, mining_height_thresh = 1) -> None:
+        """
+        vocabulary is the export_vocabulary() of another tree, when given, nodes that look the same as in that tree get the same IDs.
+        text_hash also computes textHashes, the hash of node_text of every node, to compare node texts without building them.
+        pruned_mining mines frequent patterns over the pruned_sequence of each frequency threshold, which finds the same patterns.
+        mining_height_thresh mines them over the nodes of that height or more only, see height_sequence, 1 mines all nodes.
+        """
+        self._init_columns(elm, stats, vocabulary, text_hash)
+        with self._stage('struct_tree_build'):
+            self._build(elm)
+        self._init_extraction(pattern_method, pattern_miner, pruned_mining, mining_height_thresh)
+
+    def _init_columns(self, elm, stats: ExtractionStats, vocabulary: Dict[str, dict], text_hash):
+        self.stats = stats
+        vocabulary = vocabulary or {}
+        self.tagAttrib2ID: Dict[tuple, int] = dict(vocabulary.get('tagAttrib', {})) # node signature -> node signature ID
+        self.tag2ID: Dict[tuple, int] = dict(vocabulary.get('tag', {})) # tag -> tag ID
+        self.struct2ID: Dict[tuple, int] = dict(vocabulary.get('struct', {})) # structure signature -> structure ID
+        self.htp2ID: Dict[tuple, int] = dict(vocabulary.get('htp', {}))
 
-        self.structID2Index: Dict[int, List[int]] = {} # structure ID -> list of node indexes of the structure
         self.tagAttribID2Index: Dict[int, List[int]] = {}
         self.htpID2Index: Dict[int, List[int]] = {}
 
         self.structFreqency: Dict[int, int] = {} # structure frequency
         self.structSize: Dict[int, int] = {} # structure ID -> size of the structure
         self.structHeight: Dict[int, int] = {} # structure ID -> height of the structure
-        self.nodeSequence: List[StructNode] = []
-        super().__init__(elm, 0, None, self)
-        self._assign_ID()
+
+        # node arrays indexed by post-order position
+        self._elements = None # lxml elements, found in the DOM on first access
+        self.parents = array('i') # parent index, -1 for the root
+        self.depths = array('i')
+        self.sizes = array('i')
+        self.heights = array('i')
+        self.startIndexes = array('i') # post-order position of the first node in the subtree
+        self.tagIDs = array('i')
+        self.tagAttribIDs = array('i')
+        self.htpIDs = array('i')
+        self.structIDs = array('i')
+        self.textLengths = array('i') # length of the text content of the subtree
+        self.wordCounts = array('i') # number of words in the text content of the subtree
+        self.textHashes = array('q') # hash of node_text, -1 for an empty text, only filled with text_hash
+        self.textHash = text_hash
+
+        self._elm = elm
+        self.elmLoader = None # returns the DOM of a tree loaded from a file
+        self.documentText = None # utf-8 text content of the page of a loaded tree, node i spans [textStarts[i], textEnds[i])
+        self.textStarts = self.textEnds = None
+        self.rootPath = None # XPath of the root of a loaded tree
+        self.jsonSteps = None # JSON pointer step of every node of a tree built from JSON, None for nodes that add no step
+        self.nodeSequence = NodeSequence(self)
+
+    def _init_extraction(self, pattern_method, pattern_miner, pruned_mining, mining_height_thresh):
+        self.index = len(self) - 1 # the root is the last node in post-order
         self.patternMethod = pattern_method
-        
+        self.nodeEncodingSequence = self.encoding_sequence(pattern_method)
+        self.patternMiner = pattern_miner
+        self.patternMiners = {} # pattern method -> pattern miner
+        self.prunedMining = pruned_mining
+        self.miningHeightThresh = mining_height_thresh
+        self.prunedPatternMiners = {} # (pattern method, frequency threshold or None, height threshold) -> pattern miner, original starts and ends
+        self.recordPatterns: List[tuple] = [] # patterns that produced record regions in the last extraction
+        self.strategy = None # the strategy of the last record_boundary
+        self._budget: ExtractionBudget = None # the budget and deadline of the record_boundary in progress
+        self._deadline: float = None
+        if self.stats is not None:
+            self.stats.nodes = len(self)
+
+    def __getitem__(self, i) -> StructNode:
+        return self.nodeSequence[i]
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    @property
+    def elm(self):
+        """The root element, parsed on first access for a loaded tree."""
+        if self._elm is None:
+            if self.elmLoader is None:
+                raise ValueError('The tree has no DOM, it is built by elm_loader.')
+            self._elm = self.elmLoader()
+        return self._elm
+
+    @property
+    def elements(self) -> List[object]:
+        """The lxml element of every node in post-order, found in the DOM on first access and after extend."""
+        if self._elements is None:
+            elements = _tree_elements(self.elm)
+            if len(elements) != len(self):
+                raise ValueError(f'The DOM has {len(elements)} nodes, the saved tree has {len(self)}.')
+            self._elements = elements
+        return self._elements
+
+    def _stage(self, name: str):
+        return nullcontext() if self.stats is None else self.stats.stage(name)
+
+    def _node_builder(self, nodes: list, depth: int):
+        """
+        The enter and leave steps of the one-pass encoding, shared by the DOM walk of _build and the JSON walk of
+        _build_json. enter returns the frame of a node, leave pops the top frame of the stack and appends its node to the
+        node arrays, with the node object of the frame to nodes unless it is None. depth is the depth of the first node entered.
+        """
+        parents, depths, sizes, heights, startIndexes = self.parents, self.depths, self.sizes, self.heights, self.startIndexes
+        tagIDs, tagAttribIDs, htpIDs, structIDs = self.tagIDs, self.tagAttribIDs, self.htpIDs, self.structIDs
+        tagAttrib2ID, tag2ID, htp2ID, struct2ID = self.tagAttrib2ID, self.tag2ID, self.htp2ID, self.struct2ID
+        textLengths, wordCounts, textHashes, textHash = self.textLengths, self.wordCounts, self.textHashes, self.textHash
+
+        def enter(node, children, tag: str, attribKeys: tuple, text, parentHtpID: int) -> list:
+            tagAttribID = tagAttrib2ID.setdefault((tag, attribKeys), len(tagAttrib2ID) + 1) # node ID starts from 1
+            tagID = tag2ID.setdefault(tag, len(tag2ID) + 1)
+            # an HTML tag path is keyed by the ID of its parent path and its last tag, so keys do not grow with depth
+            htpID = htp2ID.setdefault((parentHtpID, tagID), len(htp2ID) + 1)
+            # node, children, start index, tag ID, signature ID, HTP ID, child indexes, height, text so far, node text pieces so far
+            return [node, children, len(parents), tagID, tagAttribID, htpID, [], 1, _text_summary(text), _piece_summary(text) if textHash else None]
+
+        def leave(stack: list, tail):
+            node, _, startIndex, tagID, tagAttribID, htpID, childIndexes, height, text, pieces = stack.pop()
+            index = len(parents)
+            structure = []
+            for childIndex in childIndexes:
+                parents[childIndex] = index
+                structure.append(structIDs[childIndex])
+            structure.append(tagAttribID)
+            structID = struct2ID.setdefault(tuple(structure), len(struct2ID) + 1) # structure ID starts from 1
+            size = index - startIndex + 1
+            if nodes is not None:
+                nodes.append(node)
+            parents.append(-1)
+            depths.append(depth + len(stack))
+            sizes.append(size)
+            heights.append(height)
+            startIndexes.append(startIndex)
+            tagIDs.append(tagID)
+            tagAttribIDs.append(tagAttribID)
+            htpIDs.append(htpID)
+            structIDs.append(structID)
+            textLengths.append(text[0])
+            wordCounts.append(text[1])
+            if textHash:
+                textHashes.append(pieces[2] if pieces[0] else -1)
+            self.structFreqency[structID] = self.structFreqency.setdefault(structID, 0) + 1
+            self.structSize[structID] = size
+            self.structHeight[structID] = height
+            if stack:
+                parentFrame = stack[-1]
+                parentFrame[6].append(index)
+                parentFrame[7] = max(parentFrame[7], height + 1)
+                parentFrame[8] = _concat_text(_concat_text(parentFrame[8], text), _text_summary(tail))
+                if textHash:
+                    parentFrame[9] = _join_pieces(parentFrame[9], pieces)
+
+        return enter, leave
+
+    def _build(self, elm, parentHtpID: int = 0, depth: int = 0):
+        """
+        Fill the node arrays and the four node encodings with the subtree of elm in one pass. The DOM is walked
+        with an explicit stack, so deep pages do not hit the recursion limit. Node signature, tag and HTP IDs are
+        assigned when a node is entered and structure IDs when it is left, in the same order as a recursive dfs.
+        The subtree is appended after the nodes already in the arrays, parentHtpID and depth place its root below an existing node.
+        """
+        enter, leave = self._node_builder(None, depth)
+
+        def enter_element(elm, parentHtpID: int) -> list:
+            return enter(elm, iter(elm), elm.tag, tuple(sorted([k for k in elm.keys() if k not in ATTRIB_BLACK_LIST])), elm.text, parentHtpID)
+
+        stack = [enter_element(elm, parentHtpID)]
+        while stack:
+            frame = stack[-1]
+            for childElement in frame[1]:
+                if hasattr(childElement, 'tag') and type(childElement.tag) == str and childElement.tag not in TAG_BLACK_LIST:
+                    stack.append(enter_element(childElement, frame[5]))
+                    break
+                # skipped elements, such as scripts, are still in the text content, comments only with their tail
+                if hasattr(childElement, 'tag') and type(childElement.tag) == str:
+                    frame[8] = _concat_text(frame[8], _text_summary(childElement.xpath('string()')))
+                frame[8] = _concat_text(frame[8], _text_summary(childElement.tail))
+            else:
+                leave(stack, frame[0].tail)
+        self.id2TagAttrib = {v: k for k, v in self.tagAttrib2ID.items()}
+        self.id2Struct = {v: k for k, v in self.struct2ID.items()}
+
+    def _build_json(self, events: Iterable[tuple]):
+        """
+        Fill the node arrays, the four node encodings and the page text from the parse events of a JSON document in one
+        pass, without lxml elements. The nodes are the elements _json_tree converts the document to: a json root, dict,
+        list and null elements for objects, arrays and other values, and an element named after each key of an object,
+        which holds a string value as its text. The children slot of a frame keeps the kind of its node.
+        """
+        self.jsonSteps = []
+        enter, leave = self._node_builder(self.jsonSteps, 0)
+        textStarts, textEnds = array('i'), array('i')
+        pieces = []
+        offset = 0
+        stack = []
+        starts = [] # page text offset of the node of each frame
+
+        def add_text(text):
+            nonlocal offset
+            if text:
+                pieces.append(text.encode('utf-8'))
+                offset += len(pieces[-1])
+
+        def open_node(step, kind: str, tag: str, text = None):
+            stack.append(enter(step, kind, tag, (), text, stack[-1][5] if stack else 0))
+            starts.append(offset)
+            add_text(text)
+
+        def close_node():
+            leave(stack, None)
+            textStarts.append(starts.pop())
+            textEnds.append(offset)
+
+        open_node(None, 'json', 'json')
+        key = None
+        skipped = None # text of the value of a key in TAG_BLACK_LIST, which is left out like the skipped elements of a page
+        skippedLevel = 0
+        for event, value in events:
+            if skipped is not None:
+                if event == 'start_map' or event == 'start_array':
+                    skippedLevel += 1
+                elif event == 'end_map' or event == 'end_array':
+                    skippedLevel -= 1
+                elif event != 'map_key':
+                    text = value if type(value) == str else str(value)
+                    skipped = _concat_text(skipped, _text_summary(text))
+                    add_text(text)
+                if skippedLevel == 0:
+                    stack[-1][8] = _concat_text(stack[-1][8], skipped)
+                    skipped = None
+                continue
+            if event == 'map_key':
+                if value in TAG_BLACK_LIST:
+                    skipped = _EMPTY_TEXT
+                else:
+                    key = value
+                continue
+            if event == 'end_map' or event == 'end_array':
+                close_node()
+            else:
+                step = len(stack[-1][6]) if stack[-1][1] == 'list' else None
+                if stack[-1][1] == 'dict':
+                    if event == 'string':
+                        open_node(key, 'key', key, value)
+                        close_node()
+                        continue
+                    open_node(key, 'key', key)
+                    step = None
+                if event == 'start_map':
+                    open_node(step, 'dict', 'dict')
+                    continue
+                if event == 'start_array':
+                    open_node(step, 'list', 'list')
+                    continue
+                open_node(step, 'null', 'null', value if type(value) == str else str(value))
+                close_node()
+            # a finished value also finishes the key it is the value of
+            if stack[-1][1] == 'key':
+                close_node()
+        close_node()
+        self.documentText, self.textStarts, self.textEnds = b''.join(pieces), textStarts, textEnds
+        self.id2TagAttrib = {v: k for k, v in self.tagAttrib2ID.items()}
+        self.id2Struct = {v: k for k, v in self.struct2ID.items()}
+
+    @classmethod
+    def from_json(cls, input, elm_loader = None, pattern_method = STRUCT_PATTERN, pattern_miner = SUFFIX_ARRAY_MINER, stats: ExtractionStats = None, vocabulary: Dict[str, dict] = None, text_hash = False, pruned_mining = False, mining_height_thresh = 1) -> 'StructTree':
+        """
+        The tree of a JSON document, a str, bytes or file object, built from the parsed document without the lxml
+        elements of build_lxml_tree. It has the same nodes, encodings and records as StructTree(build_lxml_tree(input, format='json')).
+        """
+        with (stats.stage('json_parse') if stats is not None else nullcontext()):
+            value = _parse_json(input.read() if hasattr(input, 'read') else input)
+        return cls.from_json_events(_json_events(value), elm_loader, pattern_method, pattern_miner, stats, vocabulary, text_hash, pruned_mining, mining_height_thresh)
+
+    @classmethod
+    def from_json_events(cls, events: Iterable[tuple], elm_loader = None, pattern_method = STRUCT_PATTERN, pattern_miner = SUFFIX_ARRAY_MINER, stats: ExtractionStats = None, vocabulary: Dict[str, dict] = None, text_hash = False, pruned_mining = False, mining_height_thresh = 1) -> 'StructTree':
+        """
+        The tree of a JSON document from its parse events, (event, value) pairs like those of ijson.basic_parse, so a
+        streamed document is encoded as it is read. Like a loaded tree, text_content and node_path come from the page text
+        kept while building, and the DOM is built by elm_loader on the first access to elm or elements. json_pointer gives
+        the records as JSON pointers into the document.
+        """
+        tree = cls.__new__(cls)
+        tree._init_columns(None, stats, vocabulary, text_hash)
+        tree._elements = None
+        tree.elmLoader = elm_loader
+        tree.rootPath = '/json'
+        with tree._stage('struct_tree_build'):
+            tree._build_json(events)
+        tree._init_extraction(pattern_method, pattern_miner, pruned_mining, mining_height_thresh)
+        return tree
+
+    def json_pointer(self, i: int) -> str:
+        """The JSON pointer of node i into the document of a tree built from JSON, a key and its value share it."""
+        if self.jsonSteps is None:
+            raise ValueError('The tree is not built from JSON.')
+        steps = [str(self.jsonSteps[x]) for x in self.ancestor_indexes(i) if self.jsonSteps[x] is not None]
+        return ''.join('/' + step.replace('~', '~0').replace('/', '~1') for step in steps)
+
+    def encoding_sequence(self, pattern_method) -> Tuple[int]:
+        """The node encodings in post-order under one of the pattern methods."""
         if pattern_method == StructTree.TAG_PATTERN:
-            self.nodeEncodingSequence = tuple([x.tagID for x in self.nodeSequence])
+            return tuple(self.tagIDs)
         elif pattern_method == StructTree.NODE_SIGNATURE_PATTERN:
-            self.nodeEncodingSequence = tuple([x.tagAttribID for x in self.nodeSequence])
+            return tuple(self.tagAttribIDs)
         elif pattern_method == StructTree.HTP_PATTERN:
-            self.nodeEncodingSequence = tuple([x.htpID for x in self.nodeSequence])
+            return tuple(self.htpIDs)
         elif pattern_method == StructTree.STRUCT_PATTERN:
-            self.nodeEncodingSequence = tuple([x.structID for x in self.nodeSequence])
-        else:
+            return tuple(self.structIDs)
+        raise ValueError
+
+    def fingerprint(self, pattern_method = None) -> str:
+        """
+        Hash of all that record_boundary reads from the tree under pattern_method, the pattern method of the tree by
+        default: the encoding sequence, the tree shape, the tag IDs and which nodes have words. Trees with the same
+        fingerprint have the same records at the same post-order indexes, whatever the text and attributes of their pages.
+        """
+        pattern_method = pattern_method or self.patternMethod
+        encodings = {
+            StructTree.TAG_PATTERN: self.tagIDs,
+            StructTree.NODE_SIGNATURE_PATTERN: self.tagAttribIDs,
+            StructTree.HTP_PATTERN: self.htpIDs,
+            StructTree.STRUCT_PATTERN: self.structIDs,
+        }
+        if pattern_method not in encodings:
             raise ValueError
-        self.surffixTree = SuffixTree(self.nodeEncodingSequence)
+        digest = hashlib.blake2b(pattern_method.encode('utf-8'), digest_size=16)
+        for column in [encodings[pattern_method], self.parents, self.tagIDs]:
+            digest.update(memoryview(column).cast('B'))
+        digest.update(np.packbits(np.array(self.wordCounts) > 0).tobytes())
+        return digest.hexdigest()
 
-    def __getitem__(self, i) -> StructNode:
-        return self.nodeSequence[i]
+    @property
+    def surffixTree(self):
+        return self.pattern_miner_of(self.patternMethod)
+
+    def pattern_miner_of(self, pattern_method):
+        """The pattern miner over the encoding sequence of pattern_method, built on first use, so extraction from known patterns does not pay for it."""
+        if pattern_method not in self.patternMiners:
+            with self._stage('pattern_miner_build'):
+                sequence = self.nodeEncodingSequence if pattern_method == self.patternMethod else self.encoding_sequence(pattern_method)
+                self.patternMiners[pattern_method] = self._build_pattern_miner(sequence)
+            if self.stats is not None:
+                self.stats.minedSequenceLength = len(sequence)
+        return self.patternMiners[pattern_method]
+
+    @staticmethod
+    def pruned_sequence(sequence, freqThresh: int) -> Tuple[list, np.ndarray]:
+        """
+        The sequence without the symbols that occur fewer than freqThresh times, each run of them is replaced by one
+        unique negative separator, and the original position of every position of the pruned sequence.
+        No pattern that occurs freqThresh times can contain a dropped symbol, so the pruned sequence has the same
+        frequent patterns, and the suffix structure has the same nodes of frequency freqThresh or more, in the same order.
+        """
+        values = np.array(sequence, dtype=np.int64)
+        _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+        rare = counts[inverse] < freqThresh
+        runStart = rare.copy()
+        runStart[1:] &= ~rare[:-1]
+        positions = np.flatnonzero(~rare | runStart)
+        values = np.where(rare, -np.cumsum(runStart), values)[positions]
+        return values.tolist(), positions
+
+    def height_sequence(self, sequence, heightThresh: int) -> Tuple[list, np.ndarray, np.ndarray]:
+        """
+        The sequence of the nodes of height heightThresh or more, and the start and end of the range of the original
+        sequence each of them stands for: the node itself and the lower nodes of its subtree right before it. Unlike
+        pruned_sequence, this changes the frequent patterns, leaves no longer count towards the pattern length.
+        """
+        kept = np.flatnonzero(np.array(self.heights, dtype=np.int64) >= heightThresh)
+        starts = np.maximum(np.append(0, kept[:-1] + 1), self._nodeColumns['startIndexes'][kept])
+        return np.array(sequence, dtype=np.int64)[kept].tolist(), starts, kept + 1
+
+    def frequent_pattern(self, pattern_method, freqThresh: int, lenThresh: int, greedy = False, pruned: bool = None, heightThresh: int = None) -> Dict[tuple, List[Tuple[int, int]]]:
+        """
+        The frequent patterns of the encoding sequence of pattern_method and their occurrences, over the pruned sequence
+        if pruned and over the nodes of height heightThresh or more, which default to those of the tree.
+        """
+        if pruned is None:
+            pruned = self.prunedMining
+        if heightThresh is None:
+            heightThresh = self.miningHeightThresh
+        pruned = pruned and freqThresh >= 2
+        if not pruned and heightThresh <= 1:
+            self._check_budget('maxNodes', len(self))
+            miner = self.pattern_miner_of(pattern_method)
+            with self._stage('frequent_pattern'):
+                return miner.frequent_pattern(freqThresh, lenThresh, greedy=greedy, deadline=self._deadline)
+        key = (pattern_method, freqThresh if pruned else None, heightThresh)
+        if key not in self.prunedPatternMiners:
+            with self._stage('pattern_miner_build'):
+                sequence = self.encoding_sequence(pattern_method)
+                starts, ends = np.arange(len(sequence)), np.arange(1, len(sequence) + 1)
+                if heightThresh > 1:
+                    sequence, starts, ends = self.height_sequence(sequence, heightThresh)
+                if pruned:
+                    sequence, positions = StructTree.pruned_sequence(sequence, freqThresh)
+                    starts, ends = starts[positions], ends[positions]
+                self._check_budget('maxNodes', len(sequence))
+                self.prunedPatternMiners[key] = (self._build_pattern_miner(sequence), starts.tolist(), ends.tolist())
+            if self.stats is not None:
+                self.stats.minedSequenceLength = len(sequence)
+        miner, starts, ends = self.prunedPatternMiners[key]
+        self._check_budget('maxNodes', len(starts))
+        with self._stage('frequent_pattern'):
+            # a pattern holds no separator, so its occurrence maps to a contiguous range of the original sequence
+            return {pattern: [(starts[a], ends[b - 1]) for a, b in indexes] for pattern, indexes in miner.frequent_pattern(freqThresh, lenThresh, greedy=greedy, deadline=self._deadline).items()}
+
+    def _check_budget(self, limit: str, value = None):
+        """Raise BudgetExceeded if value is over the limit of the budget in progress, or if its deadline has passed."""
+        if self._budget is None:
+            return
+        if value is not None and getattr(self._budget, limit) is not None and value > getattr(self._budget, limit):
+            raise BudgetExceeded(limit, f'{value} is over the {limit} budget of {getattr(self._budget, limit)}.')
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise BudgetExceeded('seconds', 'The extraction ran past its deadline.')
+
+    def save(self, path: str):
+        """
+        Write the node arrays, the vocabularies and the text content of the page to path, for load() to map them back
+        without parsing the page. The file is written under a temporary name and renamed, readers never see a partial file.
+        """
+        if self.documentText is None:
+            documentText, textStarts, textEnds = _document_text(self.elm, self.elementIndexes)
+            rootPath = self.elm.getroottree().getpath(self.elm)
+        else:
+            documentText, textStarts, textEnds, rootPath = self.documentText, self.textStarts, self.textEnds, self.rootPath
+        blocks = [(name, memoryview(getattr(self, name))) for name in StructTree.SAVED_COLUMNS]
+        blocks += [('textStarts', memoryview(textStarts)), ('textEnds', memoryview(textEnds)), ('documentText', memoryview(documentText))]
+        layout = {} # name -> (item format, offset from the start of the data, size in bytes)
+        offset = 0
+        for name, block in blocks:
+            layout[name] = (block.format, offset, block.nbytes)
+            offset = _aligned(offset + block.nbytes)
+        header = pickle.dumps({
+            'vocabulary': self.export_vocabulary(),
+            'structFreqency': self.structFreqency,
+            'structSize': self.structSize,
+            'structHeight': self.structHeight,
+            'textHash': self.textHash,
+            'rootPath': rootPath,
+            'jsonSteps': self.jsonSteps,
+            'layout': layout,
+        }, protocol=pickle.HIGHEST_PROTOCOL)
+        tmpPath = f'{path}.{os.getpid()}.tmp'
+        with open(tmpPath, 'wb') as file:
+            file.write(StructTree.FILE_MAGIC)
+            file.write(len(header).to_bytes(8, 'little'))
+            file.write(header)
+            file.write(bytes(_aligned(16 + len(header)) - 16 - len(header)))
+            for name, block in blocks:
+                file.write(block)
+                file.write(bytes(_aligned(block.nbytes) - block.nbytes))
+        os.replace(tmpPath, path)
+
+    @classmethod
+    def load(cls, path: str, elm_loader = None, pattern_method = STRUCT_PATTERN, pattern_miner = SUFFIX_ARRAY_MINER, stats: ExtractionStats = None, pruned_mining = False, mining_height_thresh = 1) -> 'StructTree':
+        """
+        A tree written by save(). The node arrays and the page text are memory mapped from the file, so loading does not
+        depend on the page size. The DOM is parsed by elm_loader on the first access to elm or elements, extraction and
+        the node_path and text_content of records do not need it.
+        """
+        tree = cls.__new__(cls)
+        tree.stats = stats
+        with tree._stage('struct_tree_load'):
+            with open(path, 'rb') as file:
+                mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            if mm[:8] != StructTree.FILE_MAGIC:
+                raise ValueError(f'{path} is not a saved StructTree.')
+            headerSize = int.from_bytes(mm[8:16], 'little')
+            header = pickle.loads(mm[16:16 + headerSize])
+            data = memoryview(mm)[_aligned(16 + headerSize):]
+            for name, (format, offset, size) in header['layout'].items():
+                setattr(tree, name, data[offset:offset + size].cast(format))
+            vocabulary = header['vocabulary']
+            tree.tagAttrib2ID, tree.tag2ID, tree.struct2ID, tree.htp2ID = vocabulary['tagAttrib'], vocabulary['tag'], vocabulary['struct'], vocabulary['htp']
+            tree.id2TagAttrib = {v: k for k, v in tree.tagAttrib2ID.items()}
+            tree.id2Struct = {v: k for k, v in tree.struct2ID.items()}
+            tree.tagAttribID2Index = {}
+            tree.htpID2Index = {}
+            tree.structFreqency = header['structFreqency']
+            tree.structSize = header['structSize']
+            tree.structHeight = header['structHeight']
+            tree.textHash = header['textHash']
+            tree.rootPath = header['rootPath']
+            tree.jsonSteps = header.get('jsonSteps')
+            tree._elm = None
+            tree._elements = None
+            tree.elmLoader = elm_loader
+            tree.nodeSequence = NodeSequence(tree)
+        tree._init_extraction(pattern_method, pattern_miner, pruned_mining, mining_height_thresh)
+        return tree
+
+    def text_content(self, i: int) -> str:
+        """The text content of node i like lxml text_content(), from the saved page text for a loaded tree."""
+        if self.documentText is None:
+            return self.elements[i].text_content()
+        return bytes(self.documentText[self.textStarts[i]:self.textEnds[i]]).decode('utf-8')
+
+    def node_path(self, i: int) -> str:
+        """The XPath of node i like lxml getpath(), from the node arrays for a loaded tree."""
+        if self.documentText is None:
+            return self.elm.getroottree().getpath(self.elements[i])
+        return '/'.join([self.rootPath] + [self._pathSteps[x] for x in self.ancestor_indexes(i)[1:]])
+
+    @functools.cached_property
+    def _pathSteps(self) -> List[str]:
+        # a step is numbered among the siblings with the same tag only if there are several, skipped elements never share the tag of a node
+        keys = list(zip(self.parents, [self.id2TagAttrib[x][0] for x in self.tagAttribIDs]))
+        sameTagCnt = Counter(keys)
+        position = {}
+        ret = []
+        for key in keys:
+            position[key] = position.get(key, 0) + 1
+            ret.append(key[1] if sameTagCnt[key] == 1 else f'{key[1]}[{position[key]}]')
+        return ret
+
+    def _text_boundary(self, ancestors: List[int], reverse: bool) -> List[bool]:
+        """
+        For each of the ancestors, from the parent of the insertion point up, whether its text content before (reverse)
+        or after the end of the content of the parent ends or starts inside a word.
+        """
+        def pieces(level):
+            if level == 0:
+                if reverse:
+                    yield from _text_pieces(self.elements[ancestors[0]], reverse=True)
+                return
+            child = self.elements[ancestors[level - 1]]
+            if not reverse:
+                yield child.tail
+            for sibling in child.itersiblings(preceding=reverse):
+                if reverse:
+                    yield sibling.tail
+                if type(sibling.tag) == str:
+                    yield from _text_pieces(sibling, reverse)
+                if not reverse:
+                    yield sibling.tail
+            if reverse:
+                yield self.elements[ancestors[level]].text
+
+        ret = []
+        inWord = None
+        for level in range(len(ancestors)):
+            if inWord is None:
+                # the nearest non-empty piece decides for this ancestor and all above it
+                piece = next((t for t in pieces(level) if t), None)
+                if piece is not None:
+                    inWord = not (piece[-1] if reverse else piece[0]).isspace()
+            ret.append(bool(inWord))
+        return ret
+
+    def _append(self, parentIndex: int, elements: list) -> int:
+        """
+        Append elements to the DOM as the last children of node parentIndex and encode their subtrees at the end of the
+        arrays, then move them in bulk to their post-order place, right before the parent, and update the ancestors.
+        Return the number of new nodes, the old nodes from parentIndex on move up by that much.
+        """
+        if isinstance(self.parents, memoryview):
+            # the arrays of a loaded tree are read only
+            for name in StructTree.SAVED_COLUMNS:
+                column = array(getattr(self, name).format)
+                column.frombytes(getattr(self, name).cast('B'))
+                setattr(self, name, column)
+        parentElm = self.elements[parentIndex]
+        ancestors = list(reversed(self.ancestor_indexes(parentIndex)))
+        textBefore = self._text_boundary(ancestors, reverse=True)
+        textAfter = self._text_boundary(ancestors, reverse=False)
+        text = _EMPTY_TEXT
+        n = len(self)
+        for e in elements:
+            parentElm.append(e)
+            if hasattr(e, 'tag') and type(e.tag) == str:
+                text = _concat_text(text, _text_summary(e.xpath('string()')))
+                if e.tag not in TAG_BLACK_LIST:
+                    self._build(e, self.htpIDs[parentIndex], self.depths[parentIndex] + 1)
+            text = _concat_text(text, _text_summary(e.tail))
+        k = len(self) - n
+        p = parentIndex
+        if k > 0:
+            # index columns first, old indexes from p on move up by k, new ones move down to p
+            parents = np.frombuffer(self.parents, dtype=np.intc)
+            startIndexes = np.frombuffer(self.startIndexes, dtype=np.intc)
+            oldParents, newParents = parents[:n], parents[n:]
+            oldParents[oldParents >= p] += k
+            newParents[newParents >= 0] += p - n
+            newParents[newParents < 0] = p + k
+            # a subtree that started at p now starts at the first new node, which takes position p
+            oldStarts = startIndexes[:n]
+            oldStarts[oldStarts > p] += k
+            startIndexes[n:] += p - n
+            del parents, startIndexes, oldParents, newParents, oldStarts
+            columns = [getattr(self, name) for name in StructTree.SAVED_COLUMNS if name != 'textHashes' or self.textHash]
+            for column in columns:
+                block = column[n:]
+                del column[n:]
+                column[p:p] = block
+            self._elements = None # the new elements are found in the DOM on next access
+        parentHeight = max([self.heights[x] + 1 for x in self.children_indexes(p + k)], default=0)
+        for level, a in enumerate(ancestors):
+            a += k
+            self.sizes[a] += k
+            self.heights[a] = max(self.heights[a], parentHeight if level == 0 else self.heights[ancestors[level - 1] + k] + 1)
+            if text[0] > 0:
+                self.textLengths[a] += text[0]
+                # the new text splits a word that ran across the insertion point, and joins words at its ends
+                self.wordCounts[a] += text[1] + (textBefore[level] and textAfter[level]) - (textBefore[level] and text[2]) - (text[3] and textAfter[level])
+                if self.textHash:
+                    nodeText = self.node_text(a).encode('utf-8')
+                    self.textHashes[a] = int.from_bytes(nodeText, 'big') % _HASH_MOD if len(nodeText) > 0 else -1
+            if k > 0:
+                structure = tuple([self.structIDs[c] for c in self.children_indexes(a)] + [self.tagAttribIDs[a]])
+                oldID = self.structIDs[a]
+                structID = self.struct2ID.setdefault(structure, len(self.struct2ID) + 1)
+                self.structIDs[a] = structID
+                self.structFreqency[oldID] -= 1
+                if self.structFreqency[oldID] == 0:
+                    del self.structFreqency[oldID]
+                self.structFreqency[structID] = self.structFreqency.get(structID, 0) + 1
+                self.structSize[structID] = self.sizes[a]
+                self.structHeight[structID] = self.heights[a]
+        self.id2Struct = {v: k for k, v in self.struct2ID.items()}
+        for name in ['structID2Index', 'elementIndexes', '_depthSparseTable', '_nodeColumns', '_childTable', '_pathSteps']:
+            self.__dict__.pop(name, None)
+        self.documentText = self.textStarts = self.textEnds = self.rootPath = self.jsonSteps = None
+        self.patternMiners = {}
+        self.prunedPatternMiners = {}
+        self.index = len(self) - 1
+        self.nodeEncodingSequence = self.encoding_sequence(self.patternMethod)
+        if self.stats is not None:
+            self.stats.nodes = len(self)
+        return k
+
+    def extend(self, parentIndex: int, elements, recordGroups, lenThresh: int, freqThresh: int, recordHeightThresh, recordSizeThresh, greedyPattern=False) -> Tuple[Set[tuple], List[tuple]]:
+        """
+        Append elements as the last children of node parentIndex, such as the comments loaded by scrolling the page, and
+        find their records. recordGroups are the record groups found on the tree before. Only the new subtrees are
+        encoded, with the vocabularies of the tree, the rest of the arrays is moved in bulk and only the ancestors of
+        the new nodes are updated. Records are looked for among the new nodes only: new nodes with the container
+        signature of an old group join it, and the new nodes are mined on their own for other records.
+        Return the record groups of the grown tree, where old records have their new indexes, and the groups of new records.
+        """
+        elements = list(elements)
+        with self._stage('struct_tree_extend'):
+            k = self._append(parentIndex, elements)
+        start, end = parentIndex, parentIndex + k # the new nodes are right before their parent
+        recordGroups = set(tuple(i + k if i >= start else i for i in g) for g in recordGroups)
+        newGroups = []
+        if k == 0:
+            return recordGroups, newGroups
+        records = set()
+        with self._stage('align_records'):
+            for g in sorted(recordGroups):
+                signatures = set((self.htpIDs[i], self.tagAttribIDs[i]) for i in g)
+                candidates = [x for x in range(start, end) if x not in records and (self.htpIDs[x], self.tagAttribIDs[x]) in signatures
+                    and self.heights[x] >= recordHeightThresh and self.sizes[x] >= recordSizeThresh and self.wordCounts[x] > 0]
+                found = tuple(candidates)
+                if len(found) > 0:
+                    records.update(found)
+                    recordGroups.remove(g)
+                    recordGroups.add(tuple(sorted(g + found)))
+                    newGroups.append(found)
+        if k >= lenThresh:
+            with self._stage('frequent_pattern'):
+                frequentPattern = self._build_pattern_miner(self.nodeEncodingSequence[start:end]).frequent_pattern(freqThresh, lenThresh, greedy=greedyPattern)
+                frequentPattern = {pattern: [(a + start, b + start) for a, b in indexes] for pattern, indexes in frequentPattern.items()}
+            with self._stage('select_patterns'):
+                selectedPattern = self._select_patterns(frequentPattern)
+            for g in sorted(self.pattern_records(selectedPattern, lenThresh, freqThresh, recordHeightThresh, recordSizeThresh)):
+                # groups that overlap the records found above are the same records again
+                if all(start <= i < end and not any(self._is_ancestor(i, r) or self._is_ancestor(r, i) for r in records) for i in g):
+                    records.update(g)
+                    recordGroups.add(g)
+                    newGroups.append(g)
+        return recordGroups, newGroups
+
+    def export_vocabulary(self) -> Dict[str, dict]:
+        return {'tagAttrib': self.tagAttrib2ID, 'tag': self.tag2ID, 'struct': self.struct2ID, 'htp': self.htp2ID}
+
+    def find_patterns(self, patterns: List[tuple], heightThresh: int = None) -> Dict[tuple, List[Tuple[int, int]]]:
+        """
+        All occurrences, overlapping ones included, of each pattern in nodeEncodingSequence, like frequent_pattern returns
+        them. With a heightThresh over 1, which defaults to that of the tree, the patterns are searched in the sequence
+        of height_sequence, as mined, and their occurrences are mapped back to ranges of nodeEncodingSequence.
+        """
+        if heightThresh is None:
+            heightThresh = self.miningHeightThresh
+        if heightThresh > 1:
+            sequence, starts, ends = self.height_sequence(self.nodeEncodingSequence, heightThresh)
+            starts, ends = starts.tolist(), ends.tolist()
+        else:
+            sequence, starts, ends = self.nodeEncodingSequence, None, None
+        itemSize = array('i').itemsize
+        sequence = array('i', sequence).tobytes()
+        ret = {}
+        for pattern in patterns:
+            target = array('i', pattern).tobytes()
+            indexes = []
+            pos = sequence.find(target)
+            while pos >= 0:
+                if pos % itemSize == 0:
+                    indexes.append(pos // itemSize)
+                pos = sequence.find(target, pos + 1)
+            ret[pattern] = [(i, i + len(pattern)) if starts is None else (starts[i], ends[i + len(pattern) - 1]) for i in indexes]
+        return ret
+
+    def _build_pattern_miner(self, sequence):
+        # both miners return the same frequent patterns, the suffix array is the faster and lighter one.
+        return StructTree.PATTERN_MINERS[self.patternMiner](sequence)
+
+    @functools.cached_property
+    def structID2Index(self) -> Dict[int, List[int]]:
+        """structure ID -> indexes of the nodes of the structure."""
+        ret = {}
+        for i, structID in enumerate(self.structIDs):
+            ret.setdefault(structID, []).append(i)
+        return ret
+
+    @functools.cached_property
+    def elementIndexes(self) -> Dict[object, int]:
+        """lxml element -> node index, elements skipped by the tree are not in it."""
+        return {elm: i for i, elm in enumerate(self.elements)}
+
+    def node_text(self, i: int) -> str:
+        """The stripped texts of the nodes in the subtree of node i in document order, joined by spaces. Tails are left out."""
+        subtree = sorted(range(self.startIndexes[i], i + 1), key=lambda x: (self.startIndexes[x], -x)) # pre-order
+        return ' '.join([self.elements[x].text.strip() for x in subtree if self.elements[x].text is not None]).strip()
+
+    def annotate(self):
+        """Write the height, size, index and depth of every node into its element as data-* attributes, for the annotated HTML output."""
+        with self._stage('annotate'):
+            for i, elm in enumerate(self.elements):
+                elm.attrib['data-height'] = str(self.heights[i])
+                elm.attrib['data-size'] = str(self.sizes[i])
+                elm.attrib['data-index'] = str(i)
+                elm.attrib['data-depth'] = str(self.depths[i])
+
+    def children_indexes(self, i: int) -> List[int]:
+        """Indexes of the children of node i in document order."""
+        ret = []
+        c = i - 1
+        while c >= self.startIndexes[i]:
+            ret.append(c)
+            c = self.startIndexes[c] - 1
+        ret.reverse()
+        return ret
+
+    def ancestor_indexes(self, i: int) -> Tuple[int]:
+        """Indexes of the ancestors of node i from the root down to node i itself."""
+        ret = []
+        while i >= 0:
+            ret.append(i)
+            i = self.parents[i]
+        ret.reverse()
+        return tuple(ret)
 
     def _date_string_signature(self, strList):
         IS_NUMBER = 1
@@ -208,150 +1377,296 @@ class StructTree(StructNode):
             ret.append(tuple(signature))
         return tuple(ret)
 
-    def _assign_ID(self):
+    def _pattern_reduction(self, selectedPattern: Dict[tuple, List[Tuple[int, int]]]) -> Dict[tuple, List[Tuple[int, int]]]:
         """
-        Assign node tagAttrib ID, HTP ID, and structure ID for each node
+        Reduce the occurrences of all selected patterns in one batched pass over occurrence arrays. The LCAs of the
+        occurrences of a pattern span a branch tree, an occurrence is grouped at the deepest branch node where it meets
+        other ungrouped occurrences, and every grouped occurrence is cut down to the child subtree of its group node that
+        it overlaps most. Return the reduced occurrences of each pattern in occurrence order.
         """
-        def dfs(node: StructNode, htp):
-            node.tagAttribID = self.tagAttrib2ID.setdefault(node.tagAttrib, len(self.tagAttrib2ID) + 1) # node ID starts from 1
-            node.tagID = self.tag2ID.setdefault(node.tag, len(self.tag2ID) + 1)
-            htpNew = htp + (node.tagID,)
-            node.htpID = self.htp2ID.setdefault(htpNew, len(self.htp2ID) + 1)
-            structure = []
-            for child in node.children:
-                dfs(child, htpNew)
-                structure.append(child.structID)
-            structure.append(node.tagAttribID)
-            node.structure = tuple(structure)
-            node.structID = self.struct2ID.setdefault(node.structure, len(self.struct2ID) + 1) # structure ID starts from 1
-            self.structID2Index.setdefault(node.structID, []).append(node.index)
-            self.structFreqency[node.structID] = self.structFreqency.setdefault(node.structID, 0) + 1
-            self.structSize[node.structID] = node.size
-            self.structHeight[node.structID] = node.height
-        dfs(self, tuple())
-
-    def _pattern_reduction(self, patternIndexes):
-        # patternIndexes.sort()
-        
-        # lca2patternIndexes = {}
-        branchRoot = SimpleNamespace(index=-1, count=len(patternIndexes), children={})
-        for patternIndex in patternIndexes:
-            lca = self._lowest_common_ancestor(list(range(*patternIndex)))
-            # lca2patternIndexes.setdefault(lca, []).append(patternIndex)
-            n = branchRoot
-            for i in self[lca].ancestor_indexes:
-                n = n.children.setdefault(i, SimpleNamespace(index=i, count=0, children={}, patternIndexes=[]))
-                n.count += 1
-            n.patternIndexes.append(patternIndex)
-        
-        patternGroup = {}
-        # a leaf terminal is a node that has more than two leaf node children.
-        def group_pattern(node):
-            if len(node.children) == 0:
-                if len(node.patternIndexes) >= 2:
-                    patternGroup[node.index] = node.patternIndexes
-                    return []
-                else:
-                    return node.patternIndexes
-            patternIndexes = []
-            for child in node.children.values():
-                patternIndexes.extend(group_pattern(child))
-            if len(patternIndexes) >= 2 or (len(patternIndexes) == 1 and node.count == len(patternIndexes)):
-                patternGroup[node.index] = patternIndexes
-                return []
-            return patternIndexes
+        n = len(self)
+        counts = [len(v) for v in selectedPattern.values()]
+        total = sum(counts)
+        if total == 0:
+            return {pattern: [] for pattern in selectedPattern}
+        occurrences = np.fromiter((x for v in selectedPattern.values() for pi in v for x in pi), dtype=np.int64, count=2 * total).reshape(-1, 2)
+        lefts, rights = occurrences[:, 0], occurrences[:, 1]
+        patternIDs = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+        columns = self._nodeColumns
+        parents, startIndexes, depths = columns['parents'], columns['startIndexes'], columns['depths']
+        preorder = startIndexes + depths # the pre-order position of a node, up to a constant
+        lcas = self._lowest_common_ancestors(lefts, rights - 1)
 
-        group_pattern(branchRoot)
+        # the branch nodes of a pattern are its LCAs and the LCAs of LCAs adjacent in pre-order, numbered by (pattern, post-order)
+        lcaKeys = patternIDs * n + lcas
+        order = np.lexsort((preorder[lcas], patternIDs))
+        sortedKeys = lcaKeys[order]
+        distinct = np.ones(total, dtype=bool)
+        distinct[1:] = sortedKeys[1:] != sortedKeys[:-1]
+        lcaNodes, lcaPatterns = lcas[order][distinct], patternIDs[order][distinct]
+        adjacent = np.flatnonzero(lcaPatterns[1:] == lcaPatterns[:-1])
+        joins = self._lowest_common_ancestors(np.minimum(lcaNodes[adjacent], lcaNodes[adjacent + 1]), np.maximum(lcaNodes[adjacent], lcaNodes[adjacent + 1]))
+        branchKeys = np.unique(np.concatenate([lcaPatterns * n + lcaNodes, lcaPatterns[adjacent] * n + joins]))
+        branchNodes, branchPatterns = branchKeys % n, branchKeys // n
+        # in pre-order, the branch parent of a node is the LCA of the node and the branch node before it
+        preOrder = np.lexsort((preorder[branchNodes], branchPatterns))
+        branchParents = np.full(len(branchKeys), -1, dtype=np.int64)
+        following = np.flatnonzero(branchPatterns[preOrder[1:]] == branchPatterns[preOrder[:-1]])
+        u, v = branchNodes[preOrder[following]], branchNodes[preOrder[following + 1]]
+        parentNodes = self._lowest_common_ancestors(np.minimum(u, v), np.maximum(u, v))
+        branchParents[preOrder[following + 1]] = np.searchsorted(branchKeys, branchPatterns[preOrder[following + 1]] * n + parentNodes)
 
-        ret = []
-        for terminalIndex, patternIndexes in patternGroup.items():
-            subTreeRange = [(x.startIndex, x.endIndex) for x in self[terminalIndex].children]
-            for i, pi in enumerate(patternIndexes):
-                li = bisect(subTreeRange, (pi[0], pi[0]))
-                if li == len(subTreeRange) or (li > 0 and subTreeRange[li][1] > pi[0]):
-                    li -= 1
-                ri = bisect(subTreeRange, (pi[1], pi[1]))
-                ans = (-1, -1)
-                for j in range(li, ri):
-                    rangej = subTreeRange[j]
-                    overlap = (max(rangej[0], pi[0]), min(rangej[1], pi[1]))
-                    if overlap[1] - overlap[0] > ans[1] - ans[0]:
-                        ans = overlap
-                if ans != (-1, -1): # a dirty fix of bug that overlap is a single point.
-                    ret.append(ans)
+        occurrenceBranches = np.searchsorted(branchKeys, lcaKeys)
+        ownCounts = np.bincount(occurrenceBranches, minlength=len(branchKeys))
+        childCounts = np.bincount(branchParents[branchParents >= 0], minlength=len(branchKeys))
+        terminals = np.full(total, -1, dtype=np.int64) # the group node of each occurrence, -1 if it is dropped
+        # the occurrences of a leaf are a group if there are two or more, an occurrence at an inner branch node is dropped
+        leafOccurrences = childCounts[occurrenceBranches] == 0
+        grouped = leafOccurrences & (ownCounts[occurrenceBranches] >= 2)
+        terminals[grouped] = lcas[grouped]
+        # a single occurrence is grouped at the parent of its LCA if nothing else is below the parent, otherwise it goes up
+        single = np.flatnonzero(leafOccurrences & (ownCounts[occurrenceBranches] == 1))
+        singleBranches = occurrenceBranches[single]
+        singleParents = branchParents[singleBranches]
+        alone = (singleParents < 0) | (branchNodes[np.maximum(singleParents, 0)] != parents[lcas[single]])
+        terminals[single[alone]] = parents[lcas[single[alone]]]
+        travellers = single[~alone]
+        destinations = np.full(total, -1, dtype=np.int64) # the branch node each ungrouped occurrence went up to
+        arrivals = np.zeros(len(branchKeys), dtype=np.int64)
+        carried = np.full(len(branchKeys), -1, dtype=np.int64)
+
+        def go_up(occurrenceIDs, targets):
+            destinations[occurrenceIDs] = targets
+            np.add.at(arrivals, targets, 1)
+            carried[targets] = occurrenceIDs
+
+        go_up(travellers, branchParents[occurrenceBranches[travellers]])
+        # inner branch nodes bottom-up by depth, two or more arrivals make a group, a single one goes on up
+        inner = np.flatnonzero(childCounts > 0)
+        inner = inner[np.argsort(-depths[branchNodes[inner]], kind='stable')]
+        innerDepths = depths[branchNodes[inner]]
+        for level in np.split(inner, np.flatnonzero(innerDepths[1:] != innerDepths[:-1]) + 1):
+            level = level[(arrivals[level] == 1) & (branchParents[level] >= 0)]
+            go_up(carried[level], branchParents[level])
+        travelled = np.flatnonzero(destinations >= 0)
+        travelled = travelled[arrivals[destinations[travelled]] >= 2]
+        terminals[travelled] = branchNodes[destinations[travelled]]
+
+        # the child subtree of the group node with the largest overlap, the first one on ties
+        reduced = np.flatnonzero(terminals >= 0)
+        overlaps = np.zeros((total, 2), dtype=np.int64)
+        if len(reduced) > 0:
+            childKeys, children, childSizes, sizeTable = self._childTable
+            t, a, b = terminals[reduced], lefts[reduced], rights[reduced]
+            blockEnds = np.searchsorted(childKeys, (t + 1) * n)
+            first = np.searchsorted(childKeys, t * n + a)
+            last = np.minimum(np.searchsorted(childKeys, t * n + b - 1), blockEnds - 1)
+            valid = first < blockEnds
+            first, last = np.where(valid, first, 0), np.where(valid, last, 0)
+
+            def overlap(p):
+                c = children[p]
+                return np.maximum(startIndexes[c], a), np.minimum(c + 1, b)
+
+            bestLeft, bestRight = overlap(first)
+            lastLeft, lastRight = overlap(last)
+            middle = last - first >= 2
+            m = self._first_max(sizeTable, childSizes, np.where(middle, first + 1, 0), np.where(middle, last - 1, 0))
+            middle &= childSizes[m] > bestRight - bestLeft
+            bestLeft = np.where(middle, startIndexes[children[m]], bestLeft)
+            bestRight = np.where(middle, children[m] + 1, bestRight)
+            right = (last > first) & (lastRight - lastLeft > bestRight - bestLeft)
+            bestLeft, bestRight = np.where(right, lastLeft, bestLeft), np.where(right, lastRight, bestRight)
+            keep = valid & (bestRight > bestLeft)
+            overlaps[reduced] = np.stack([bestLeft, bestRight], axis=1)
+            terminals[reduced[~keep]] = -1
+        kept = (terminals >= 0).tolist()
+        pairs = list(zip(overlaps[:, 0].tolist(), overlaps[:, 1].tolist()))
+        ret = {}
+        offset = 0
+        for pattern, count in zip(selectedPattern, counts):
+            ret[pattern] = [pairs[i] for i in range(offset, offset + count) if kept[i]]
+            offset += count
+        return ret
+
+    @functools.cached_property
+    def _depthSparseTable(self) -> List[np.ndarray]:
+        """
+        Sparse table for range minimum queries over the post-order depths,
+        level k holds the index of the shallowest node among positions [i, i + 2^k).
+        """
+        depths = np.array(self.depths, dtype=np.int32)
+        table = [np.arange(len(depths), dtype=np.int32)]
+        half = 1
+        while half * 2 <= len(depths):
+            a, b = table[-1][:-half], table[-1][half:]
+            table.append(np.where(depths[b] < depths[a], b, a))
+            half *= 2
+        return table
+
+    def _shallowest_node(self, left: int, right: int) -> int:
+        """Index of a shallowest node among post-order positions [left, right]."""
+        k = (right - left + 1).bit_length() - 1
+        level = self._depthSparseTable[k]
+        a = int(level[left])
+        b = int(level[right - (1 << k) + 1])
+        return b if self.depths[b] < self.depths[a] else a
+
+    def _shallowest_nodes(self, lefts: np.ndarray, rights: np.ndarray) -> np.ndarray:
+        """_shallowest_node over arrays of post-order ranges."""
+        depths = self._nodeColumns['depths']
+        ks = np.frexp(rights - lefts + 1)[1] - 1
+        ret = np.empty(len(lefts), dtype=np.int64)
+        for k in np.unique(ks).tolist():
+            mask = ks == k
+            level = self._depthSparseTable[k]
+            a, b = level[lefts[mask]], level[rights[mask] - (1 << k) + 1]
+            ret[mask] = np.where(depths[b] < depths[a], b, a)
+        return ret
+
+    def _lowest_common_ancestors(self, us: np.ndarray, vs: np.ndarray) -> np.ndarray:
+        """_pairwise_lowest_common_ancestor over arrays of node pairs, us[i] <= vs[i]."""
+        parents = self._nodeColumns['parents']
+        ret = vs.copy()
+        split = self._nodeColumns['startIndexes'][vs] > us
+        if split.any():
+            ret[split] = parents[self._shallowest_nodes(us[split], vs[split] - 1)]
         return ret
 
+    @functools.cached_property
+    def _nodeColumns(self) -> Dict[str, np.ndarray]:
+        """int64 NumPy copies of the node arrays read by the batched stages."""
+        return {name: np.array(getattr(self, name), dtype=np.int64) for name in ['parents', 'depths', 'sizes', 'startIndexes', 'tagIDs']}
+
+    @functools.cached_property
+    def _childTable(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[np.ndarray]]:
+        """
+        The nodes ordered by parent and then post-order, so the children of a node are a block in document order.
+        Return the (parent * len + node) keys, the nodes, their subtree sizes and a sparse table whose level k holds
+        the position of the first largest subtree among positions [i, i + 2^k).
+        """
+        parents = self._nodeColumns['parents']
+        children = np.argsort(parents, kind='stable')
+        childSizes = self._nodeColumns['sizes'][children]
+        table = [np.arange(len(children), dtype=np.int64)]
+        half = 1
+        while half * 2 <= len(children):
+            a, b = table[-1][:-half], table[-1][half:]
+            table.append(np.where(childSizes[b] > childSizes[a], b, a))
+            half *= 2
+        return parents[children] * len(parents) + children, children, childSizes, table
+
+    @staticmethod
+    def _first_max(table: List[np.ndarray], values: np.ndarray, lefts: np.ndarray, rights: np.ndarray) -> np.ndarray:
+        """Position of the first largest value among positions [lefts[i], rights[i]] from a sparse table of _childTable."""
+        ks = np.frexp(rights - lefts + 1)[1] - 1
+        ret = np.empty(len(lefts), dtype=np.int64)
+        for k in np.unique(ks).tolist():
+            mask = ks == k
+            a, b = table[k][lefts[mask]], table[k][rights[mask] - (1 << k) + 1]
+            ret[mask] = np.where(values[b] > values[a], b, a)
+        return ret
+
+    def _is_ancestor(self, ancestorIndex: int, nodeIndex: int) -> bool:
+        """True if nodeIndex is in the subtree of ancestorIndex, a node is an ancestor of itself."""
+        return self.startIndexes[ancestorIndex] <= nodeIndex <= ancestorIndex
+
+    def _pairwise_lowest_common_ancestor(self, u: int, v: int) -> int:
+        if u > v:
+            u, v = v, u
+        if self._is_ancestor(v, u):
+            return v
+        # the post-order positions [u, v) hold the subtrees of the children of the LCA that lie between u and v,
+        # so a shallowest node among them is a child of the LCA.
+        return self.parents[self._shallowest_node(u, v - 1)]
+
     def _lowest_common_ancestor(self, nodeIndexes: List[int])->int:
-        ancestorPaths = [self[i].ancestor_indexes for i in nodeIndexes]
-        L = min([len(p) for p in ancestorPaths])
-        i = 0
-        while i + 1 < L and len(set([path[i+1] for path in ancestorPaths])) == 1:
-            i += 1
-        return ancestorPaths[0][i]
+        # the subtree of a node is a post-order interval, so the first and the last node decide the LCA of all.
+        return self._pairwise_lowest_common_ancestor(min(nodeIndexes), max(nodeIndexes))
+
+    def _outermost_nodes(self, nodeIndexes) -> List[int]:
+        """The nodes that have no ancestor among nodeIndexes, sorted by post-order, their subtrees are disjoint."""
+        ret = []
+        for i in sorted(nodeIndexes, key=lambda x: (self.startIndexes[x], -x)):
+            if len(ret) == 0 or i > ret[-1]:
+                ret.append(i)
+        return ret
 
     def _get_anchor(self, patternIndexes):
         anchorIndexes = set()
         for li, ri in patternIndexes:
             # find the nearest common ancestor of the nodes in the sequence
-            anchorIndexes.add(self._lowest_common_ancestor([node.index for node in self.nodeSequence[li:ri]]))
+            anchorIndexes.add(self._pairwise_lowest_common_ancestor(li, ri - 1))
         return sorted(list(anchorIndexes))
 
     def _align_records(self, anchorIndexes, freqThresh: int):
-        class PathTrieNode:
-            def __init__(self, children = {}, indexes = [], prevIndexes = []) -> None:
-                self.children = children
-                self.indexes = indexes
-                self.prevIndexes = prevIndexes
-
-        def build_path_trie(indexes, prevIndexes, index2Node:StructTree):
-            indexGroups = {}
-            prevIndexGroups = {}
-            for i in indexes:
-                parentNode = index2Node[i].parent
-                if parentNode is None: continue
-
-                indexGroups.setdefault(parentNode.tag, []).append(parentNode.index)
-                prevIndexGroups.setdefault(parentNode.tag, []).append(i)
-            children = {}
-            for k, v in indexGroups.items():
-                children[k] = build_path_trie(v, prevIndexGroups[k], index2Node)
-            trieNode = PathTrieNode(children=children, indexes=indexes, prevIndexes=prevIndexes)
-            return trieNode
-        
-        def align(node: PathTrieNode, ans: List[int], index2Node: List[StructNode])->bool:
-            # return True if alignment should stop at this trie node
-            MAX_MERGE = 2
-            if len(node.indexes) < freqThresh:
-                return False
-            groupCnt = Counter(node.indexes)
-            if self._lowest_common_ancestor(groupCnt.keys()) in groupCnt:
-                return True
-            if max(groupCnt.values()) > MAX_MERGE:
-                return True
-
-            merge = False
-            for child in node.children.values():
-                if align(child, ans, index2Node):
-                    merge = True
-                    ans.extend(child.prevIndexes)
-                    
-            if merge:
-                for child in node.children.values():
-                    if len(child.indexes) < freqThresh:
-                        ans.extend(child.prevIndexes)
-
-            return False
-
-        root = build_path_trie(anchorIndexes, None, self.nodeSequence)
-        ans = []
-        if align(root, ans, self):
+        """
+        Align the anchors on their path trie, walked level by level over arrays. A trie node at level d groups ancestors
+        at distance d of the anchors, by the trie node of their children and by their tag. Alignment stops at a trie node
+        with fewer than freqThresh ancestors, or at one whose ancestors hold their own LCA or the same ancestor more than
+        MAX_MERGE times. The latter gives its children, the ancestors at distance d - 1, as record containers, and makes
+        the small trie nodes next to it give theirs too.
+        """
+        MAX_MERGE = 2
+        columns = self._nodeColumns
+        parents, startIndexes, tagIDs = columns['parents'], columns['startIndexes'], columns['tagIDs']
+        anchors = np.array(anchorIndexes, dtype=np.int64)
+        if len(anchors) < freqThresh or len(anchors) == 0:
+            if self.stats is not None:
+                self.stats.trieNodesPerPattern.append(1)
+            return []
+        # the anchors are distinct, so the root of the trie only stops if the highest anchor is the LCA of all of them
+        if startIndexes[anchors.max()] <= anchors.min():
+            if self.stats is not None:
+                self.stats.trieNodesPerPattern.append(1)
             return anchorIndexes
-        return ans
-
-    def record_boundary(self, lenThresh: int, freqThresh: int, recordHeightThresh, recordSizeThresh, greedyPattern=False):
-        # assert freqThresh >= 3
-        frequentPattern = self.surffixTree.frequent_pattern(freqThresh, lenThresh, greedy=greedyPattern)
+        tagCnt = int(tagIDs.max()) + 1
+        trieSize = 1
+        ans = []
+        # the items of a level are (trie node, ancestor, child of the ancestor) of the trie nodes still being walked
+        nodeCnt = 1
+        nodes = np.zeros(len(anchors), dtype=np.int64)
+        current = anchors
+        while len(current) > 0:
+            self._check_budget('seconds')
+            upper = parents[current]
+            kept = upper >= 0
+            nodes, previous, current = nodes[kept], current[kept], upper[kept]
+            if len(current) == 0:
+                break
+            # the items ordered by trie node and ancestor, a trie node is a (trie node of the children, tag) key
+            keys = nodes * tagCnt + tagIDs[current]
+            order = np.lexsort((current, keys))
+            keys, previous, current = keys[order], previous[order], current[order]
+            newNode = np.empty(len(keys), dtype=bool)
+            newNode[0] = True
+            np.not_equal(keys[1:], keys[:-1], out=newNode[1:])
+            newRun = newNode.copy()
+            newRun[1:] |= current[1:] != current[:-1]
+            nodes = np.cumsum(newNode) - 1
+            first = np.flatnonzero(newNode)
+            last = np.append(first[1:], len(keys)) - 1
+            keys = keys[first]
+            trieSize += len(keys)
+            # the size, the lowest and highest ancestor and the most repeated ancestor of each trie node
+            runs = np.flatnonzero(newRun)
+            maxRuns = np.maximum.reduceat(np.diff(runs, append=len(newRun)), np.searchsorted(runs, first))
+            sizes = last - first + 1
+            small = sizes < freqThresh
+            stop = ~small & ((startIndexes[current[last]] <= current[first]) | (maxRuns > MAX_MERGE))
+            merged = np.zeros(nodeCnt, dtype=bool)
+            merged[keys[stop] // tagCnt] = True
+            given = stop | (small & merged[keys // tagCnt])
+            ans.append(previous[given[nodes]])
+            going = ~small & ~stop
+            nodeCnt = int(going.sum())
+            kept = going[nodes]
+            nodes, current = (np.cumsum(going) - 1)[nodes[kept]], current[kept]
+        if self.stats is not None:
+            self.stats.trieNodesPerPattern.append(trieSize)
+        return np.concatenate(ans).tolist() if len(ans) > 0 else []
 
+    def _select_patterns(self, frequentPattern):
         # pattern selection
         # Treat patterns of the same support to be from the same group of records.
         # This is not the correct way to determine patterns from the same group of records, should be improved in the future.
@@ -367,27 +1682,9 @@ class StructTree(StructNode):
             else:
                 selectedPattern[pattern] = patternIndexes
                 supportDict[len(patternIndexes)] = pattern
+        return selectedPattern
 
-        # pattern reduction
-        reducedPattern = {}
-        for pattern, patternIndexesO in list(selectedPattern.items()):
-            patternIndexes = self._pattern_reduction(patternIndexesO)
-            patternIndexes = [x for x in patternIndexes if x[1] - x[0] >= lenThresh]
-            if len(patternIndexes) > 0:
-                reducedPattern[pattern] = patternIndexes
-
-        recordRegion = set()
-        # for sid in freqStruct:
-        for pattern, patternIndexes in reducedPattern.items():
-            anchorIndexes = self._get_anchor(patternIndexes)
-            if len(set(anchorIndexes)) < freqThresh:
-                continue
-            recordContainerIndexes = set(self._align_records(anchorIndexes, freqThresh))
-            recordContainerIndexes = [x for x in recordContainerIndexes if self[x].height >= recordHeightThresh and self[x].size >= recordSizeThresh and len(self[x].elm.text_content().split()) > 0]
-            if len(recordContainerIndexes) > 0:
-                regionNodeIndex = self._lowest_common_ancestor(recordContainerIndexes)
-                recordRegion.add(tuple(sorted(recordContainerIndexes)))
-
+    def _clean_nested_records(self, recordRegion, freqThresh: int):
         ret = set()
         # clean nested trivial records
         # if multiple records has a parent that is also a record, and their parent records are different, then, remove them. If parent records are the same, they could be nested category records.
@@ -397,22 +1694,173 @@ class StructTree(StructNode):
             parentCnt = 0
             parentRecords= set()
             nestedRecords = set()
+            # the outermost record of other groups above a record is its parent record
+            outerRecords = self._outermost_nodes(recordIndexes.difference(group))
+            outerStartIndexes = [self.startIndexes[a] for a in outerRecords]
             for i in group:
-                ancestorIndexes = self[i].ancestor_indexes
-                for a in ancestorIndexes[:-1]: # ancestor index includes self
-                    if a in recordIndexes and a not in group:
-                        parentCnt += 1
-                        parentRecords.add(a)
-                        nestedRecords.add(i)
-                        break
-                        # else:
-                        #     print('')
+                j = bisect(outerStartIndexes, i) - 1
+                if j >= 0 and self._is_ancestor(outerRecords[j], i):
+                    parentCnt += 1
+                    parentRecords.add(outerRecords[j])
+                    nestedRecords.add(i)
             if len(parentRecords) >= len(nestedRecords) * 0.9 and len(parentRecords) >= freqThresh:
                 group.difference_update(nestedRecords)
             if len(group) > freqThresh:
                 ret.add(tuple(sorted(group)))
 
         return ret
+
+    def record_boundary(self, lenThresh: int, freqThresh: int, recordHeightThresh, recordSizeThresh, greedyPattern=False, budget: ExtractionBudget = None):
+        """
+        The record groups of the page. With a budget, extraction degrades to a cheaper strategy when a limit is hit:
+        "greedy" skips the count reduction of the closed pattern search, "pruned" mines the shorter pruned sequence,
+        "filtered" mines the nodes of the lowest height threshold that fits budget.maxNodes, or the budget.fallbackShare
+        of the nodes once budget.seconds is hit, and "capped" keeps the frequent patterns with the most occurrences and
+        as many selected patterns as the budget allows, over the nodes of "filtered" once one of these limits is hit.
+        A strategy that does not lower the limit hit is passed over, "filtered" is the next one once the time is out.
+        The full strategy has budget.seconds but the budget.fallbackShare of it, the other strategies split that share,
+        each one has to finish by its part of it added to what the ones before left. If none finishes, no record is
+        found. The strategy used is kept in self.strategy, "skipped" if none finished.
+        """
+        # assert freqThresh >= 3
+        if budget is None:
+            self.strategy = StructTree.FULL_STRATEGY
+            return self._record_boundary(lenThresh, freqThresh, recordHeightThresh, recordSizeThresh, greedyPattern, self.prunedMining, False, self.miningHeightThresh)
+        heightThresh = self.miningHeightThresh
+        strategies = [(StructTree.FULL_STRATEGY, greedyPattern, self.prunedMining, False, heightThresh)]
+        if not greedyPattern:
+            strategies.append((StructTree.GREEDY_STRATEGY, True, self.prunedMining, False, heightThresh))
+        if not self.prunedMining:
+            strategies.append((StructTree.PRUNED_STRATEGY, True, True, False, heightThresh))
+        # the filtered height of each limit: the nodes that fit maxNodes, and the nodes that the share of the time kept
+        # for the cheaper strategies mines at the pace of the full strategy
+        filteredHeights = {'maxNodes': self._fitting_height(budget.maxNodes)}
+        if budget.seconds is not None:
+            filteredHeights['seconds'] = self._fitting_height(int(len(self) * budget.fallbackShare))
+        if any(h is not None for h in filteredHeights.values()):
+            strategies.append((StructTree.FILTERED_STRATEGY, True, True, False, None))
+        strategies.append((StructTree.CAPPED_STRATEGY, True, True, True, heightThresh))
+        start = time.perf_counter()
+        exceeded = []
+        ret = set()
+        self.strategy = StructTree.SKIPPED_STRATEGY
+        self._budget = budget
+        lastMining = None # (height threshold, pruned) of the last strategy run, a larger one mines a shorter sequence
+        try:
+            for k, (strategy, greedy, pruned, capped, heightThresh) in enumerate(strategies):
+                if heightThresh is None or capped:
+                    # filtered, and capped after it, mine the nodes of the highest filtered height of the limits hit
+                    heights = [h for limit, h in filteredHeights.items() if limit in exceeded and h is not None]
+                    heightThresh = max(heights, default=self.miningHeightThresh if capped else None)
+                    if heightThresh is None:
+                        continue
+                if len(exceeded) > 0 and ((exceeded[-1] == 'maxNodes' and (heightThresh, pruned) <= lastMining) or (exceeded[-1] in ['maxPatterns', 'maxOccurrences'] and not capped)
+                        or (exceeded[-1] == 'seconds' and heightThresh < (filteredHeights.get('seconds') or 0))):
+                    continue
+                lastMining = (heightThresh, pruned)
+                self._deadline = None if budget.seconds is None else start + budget.seconds * (1 - budget.fallbackShare * (len(strategies) - 1 - k) / max(len(strategies) - 1, 1))
+                # the per pattern statistics of a strategy given up are dropped
+                statsLengths = {} if self.stats is None else {name: len(v) for name, v in vars(self.stats).items() if isinstance(v, list)}
+                try:
+                    ret = self._record_boundary(lenThresh, freqThresh, recordHeightThresh, recordSizeThresh, greedy, pruned, capped, heightThresh)
+                except (BudgetExceeded, TimeoutError) as e:
+                    exceeded.append(e.limit if isinstance(e, BudgetExceeded) else 'seconds')
+                    for name, length in statsLengths.items():
+                        del getattr(self.stats, name)[length:]
+                    self.recordPatterns = []
+                    continue
+                self.strategy = strategy
+                break
+        finally:
+            self._budget = self._deadline = None
+        if self.stats is not None:
+            self.stats.strategy = self.strategy
+            self.stats.budgetExceeded = exceeded
+        return ret
+
+    def _fitting_height(self, maxNodes: int) -> int:
+        """The lowest height threshold above miningHeightThresh whose nodes are no more than maxNodes, None if there is none."""
+        if maxNodes is None:
+            return None
+        nodeCnts = np.cumsum(np.bincount(np.array(self.heights, dtype=np.int64))[::-1])[::-1] # nodes of each height or more
+        fits = np.flatnonzero(nodeCnts <= maxNodes)
+        fits = fits[fits > max(self.miningHeightThresh, 1)]
+        return int(fits[0]) if len(fits) > 0 else None
+
+    def _record_boundary(self, lenThresh: int, freqThresh: int, recordHeightThresh, recordSizeThresh, greedy: bool, pruned: bool, capped: bool, heightThresh: int):
+        frequentPattern = self.frequent_pattern(self.patternMethod, freqThresh, lenThresh, greedy=greedy, pruned=pruned, heightThresh=heightThresh)
+        if capped and self._budget.maxPatterns is not None and len(frequentPattern) > self._budget.maxPatterns:
+            kept = set(sorted(frequentPattern, key=lambda p: -len(frequentPattern[p]))[:self._budget.maxPatterns])
+            frequentPattern = {p: v for p, v in frequentPattern.items() if p in kept}
+        self._check_budget('maxPatterns', len(frequentPattern))
+        with self._stage('select_patterns'):
+            selectedPattern = self._select_patterns(frequentPattern)
+        if capped and self._budget.maxOccurrences is not None:
+            occurrences = 0
+            for pattern in list(selectedPattern):
+                if occurrences + len(selectedPattern[pattern]) > self._budget.maxOccurrences:
+                    del selectedPattern[pattern]
+                else:
+                    occurrences += len(selectedPattern[pattern])
+        self._check_budget('maxOccurrences', sum(len(v) for v in selectedPattern.values()))
+        ret = self.pattern_records(selectedPattern, lenThresh, freqThresh, recordHeightThresh, recordSizeThresh)
+        if self.stats is not None:
+            self.stats.frequentPatterns = len(frequentPattern)
+            self.stats.selectedPatterns = len(selectedPattern)
+        return ret
+
+    def sweep(self, configs: Iterable['ExtractionConfig']) -> Iterator[Tuple['ExtractionConfig', Set[tuple]]]:
+        """
+        Yield each config with its record_boundary result, the tree is shared by all of them. One pattern miner is built
+        per encoding, and configs that differ only in the record thresholds share the mined and selected patterns.
+        """
+        selectedPatterns = {}
+        for config in configs:
+            key = (config.patternMethod, config.lenThresh, config.freqThresh, config.greedyPattern)
+            if key not in selectedPatterns:
+                frequentPattern = self.frequent_pattern(config.patternMethod, config.freqThresh, config.lenThresh, greedy=config.greedyPattern)
+                with self._stage('select_patterns'):
+                    selectedPatterns[key] = self._select_patterns(frequentPattern)
+            yield config, self.pattern_records(selectedPatterns[key], config.lenThresh, config.freqThresh, config.recordHeightThresh, config.recordSizeThresh)
+
+    def pattern_records(self, selectedPattern: Dict[tuple, List[Tuple[int, int]]], lenThresh: int, freqThresh: int, recordHeightThresh, recordSizeThresh):
+        """The record groups found from the occurrences of the selected patterns, the second half of record_boundary."""
+        self.recordPatterns = []
+        # pattern reduction
+        reducedPattern = {}
+        with self._stage('pattern_reduction'):
+            reduced = self._pattern_reduction(selectedPattern)
+            for pattern, patternIndexesO in selectedPattern.items():
+                patternIndexes = [x for x in reduced[pattern] if x[1] - x[0] >= lenThresh]
+                if len(patternIndexes) > 0:
+                    reducedPattern[pattern] = patternIndexes
+                if self.stats is not None:
+                    self.stats.occurrencesBeforeReduction.append(len(patternIndexesO))
+                    self.stats.occurrencesAfterReduction.append(len(patternIndexes))
+
+        recordRegion = set()
+        # for sid in freqStruct:
+        with self._stage('align_records'):
+            for pattern, patternIndexes in reducedPattern.items():
+                self._check_budget('seconds')
+                anchorIndexes = self._get_anchor(patternIndexes)
+                if self.stats is not None:
+                    self.stats.anchorsPerPattern.append(len(anchorIndexes))
+                if len(set(anchorIndexes)) < freqThresh:
+                    continue
+                recordContainerIndexes = set(self._align_records(anchorIndexes, freqThresh))
+                recordContainerIndexes = [x for x in recordContainerIndexes if self.heights[x] >= recordHeightThresh and self.sizes[x] >= recordSizeThresh and self.wordCounts[x] > 0]
+                if len(recordContainerIndexes) > 0:
+                    regionNodeIndex = self._lowest_common_ancestor(recordContainerIndexes)
+                    recordRegion.add(tuple(sorted(recordContainerIndexes)))
+                    self.recordPatterns.append(pattern)
+
+        with self._stage('clean_nested_records'):
+            ret = self._clean_nested_records(recordRegion, freqThresh)
+        if self.stats is not None:
+            self.stats.recordGroups = len(ret)
+            self.stats.records = sum(len(g) for g in ret)
+        return ret
     
     def structure_sequence(self, heightThresh: int, sizeThresh: int) -> List[int]:
-        return [(i, node.structID) for (i, node) in enumerate (self.nodeSequence) if node.height >= heightThresh and node.size >= sizeThresh]
\ No newline at end of file
+        return [(i, structID) for (i, structID) in enumerate(self.structIDs) if self.heights[i] >= heightThresh and self.sizes[i] >= sizeThresh]